@@ -0,0 +1,170 @@
+import hashlib
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, current_app, request
+
+from model import (db, Show, Venue, Artist, get_venue_with_shows,
+                   get_artist_with_shows, request_now)
+from pagination import keyset_page
+
+
+# Read-only JSON API. Every response carries a strong ETag computed from row
+# versions (`updated_at`) with a small query, and a matching If-None-Match
+# is answered with 304 before the payload is loaded or serialized.
+
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+    return json_response({'error': error.description}, make_etag(error.code)), error.code
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def json_response(payload, etag):
+    response = Response(
+        json.dumps(payload, separators=(',', ':'), default=json_default),
+        mimetype='application/json'
+    )
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def conditional(etag, build):
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return json_response(build(), etag)
+
+
+def page_args():
+    per_page = request.args.get('per_page', current_app.config['PAGE_SIZE'], type=int)
+    return {
+        'after': request.args.get('after'),
+        'before': request.args.get('before'),
+        'per_page': min(max(per_page, 1), current_app.config['MAX_PAGE_SIZE']),
+    }
+
+
+def versioned_page(query, columns):
+    try:
+        return keyset_page(query, columns, **page_args())
+    except ValueError:
+        abort(400)
+
+
+def page_payload(page, data):
+    return {'data': data, 'next': page.next_cursor, 'prev': page.prev_cursor}
+
+
+def entity_version(model, show_column, counterpart, counterpart_column, entity_id):
+    # The detail payload depends on the entity, its shows, the names and
+    # images of the counterparts, and on how many shows are still upcoming.
+    return db.session.query(
+        model.updated_at,
+        db.func.count(Show.id),
+        db.func.max(Show.updated_at),
+        db.func.max(counterpart.updated_at),
+        db.func.count(Show.id).filter(Show.start_time > request_now())
+    ).outerjoin(Show, show_column == model.id).outerjoin(
+        counterpart, counterpart_column == counterpart.id
+    ).filter(model.id == entity_id).group_by(model.id).first()
+
+
+def entity_summary(entity, seeking):
+    return {
+        'id': entity.id,
+        'name': entity.name,
+        'city': entity.city,
+        'state': entity.state,
+        'genres': entity.genres,
+        seeking: getattr(entity, seeking),
+        'image_link': entity.image_link,
+    }
+
+
+def entity_list(model, seeking):
+    page = versioned_page(
+        db.session.query(model.id, model.updated_at), [model.id])
+    etag = make_etag(model.__tablename__, page.items,
+                     page.next_cursor, page.prev_cursor)
+
+    def build():
+        ids = [row.id for row in page.items]
+        entities = model.query.filter(model.id.in_(ids)).order_by(model.id).all()
+        return page_payload(page, [entity_summary(e, seeking) for e in entities])
+    return conditional(etag, build)
+
+
+@api.route('/venues')
+def venues():
+    return entity_list(Venue, 'seeking_talent')
+
+
+@api.route('/artists')
+def artists():
+    return entity_list(Artist, 'seeking_venue')
+
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    version = entity_version(Venue, Show.venue_id, Artist, Show.artist_id, venue_id)
+    if version is None:
+        abort(404)
+    return conditional(
+        make_etag('venue', venue_id, *version),
+        lambda: get_venue_with_shows(venue_id).full_venue_details)
+
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    version = entity_version(Artist, Show.artist_id, Venue, Show.venue_id, artist_id)
+    if version is None:
+        abort(404)
+    return conditional(
+        make_etag('artist', artist_id, *version),
+        lambda: get_artist_with_shows(artist_id).full_artist_details)
+
+
+@api.route('/shows')
+def shows():
+    page = versioned_page(
+        db.session.query(
+            Show.id, Show.start_time, Show.updated_at,
+            Venue.updated_at, Artist.updated_at
+        ).join(Venue, Show.venue_id == Venue.id).join(
+            Artist, Show.artist_id == Artist.id),
+        [Show.start_time, Show.id])
+    etag = make_etag('shows', page.items, page.next_cursor, page.prev_cursor)
+
+    def build():
+        ids = [row.id for row in page.items]
+        rows = db.session.query(
+            Show.id, Show.start_time, Show.venue_id, Venue.name,
+            Show.artist_id, Artist.name, Artist.image_link
+        ).join(Venue, Show.venue_id == Venue.id).join(
+            Artist, Show.artist_id == Artist.id
+        ).filter(Show.id.in_(ids)).order_by(Show.start_time, Show.id).all()
+        return page_payload(page, [{
+            'id': row[0],
+            'start_time': row[1].isoformat(),
+            'venue_id': row[2],
+            'venue_name': row[3],
+            'artist_id': row[4],
+            'artist_name': row[5],
+            'artist_image_link': row[6],
+        } for row in rows])
+    return conditional(etag, build)
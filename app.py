@@ -2,21 +2,39 @@
 # Imports
 # ----------------------------------------------------------------------------#
 
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, session
 from logging import Formatter, FileHandler
-from model import db, Show, Artist, Venue
+from model import (db, Show, Artist, Venue, venue_areas_query, venues_by_area,
+                   get_venue_with_shows, get_artist_with_shows,
+                   next_upcoming_start, request_now, venue_artist_ids, artist_venue_ids)
 from flask_migrate import Migrate
 from distutils.log import error
 from flask_moment import Moment
-from datetime import datetime
 from flask_wtf import Form
-from command import seed
-import dateutil.parser
+from command import (seed, refresh_facets, roll_show_stats, purge_sessions, process_images,
+                     queue_images, build_assets, export as export_command)
+from bench import bench_show_plans, bench_home, bench_format, bench_servers, bench_routes
+from search import search
+from pagination import keyset_page
+from cache import render_cache
+from snapshot import home_snapshot
+from api import api
+from export import export
+from session import init_session
+from availability import availability_index, free_slots, parse_query
+from recommend import recommender
+from stats import recompute_stats
+from instrumentation import instrumentation
+from facets import (KINDS as FACET_KINDS, facet_values, update_facet_counts,
+                    parse_filters, filtered_query, facet_summary, matching_total)
+from booking import book_show, book_shows, BookingError, BookingConflict
+from assets import assets
+from images import thumbnail_index, enqueue_images, save_upload, ImageError
+from formatting import format_datetime, default_preferences, valid_locale, valid_timezone
+from sqlalchemy.orm import joinedload
 from forms import *
 import logging
 import json
-import babel
-import sys
 
 
 # ----------------------------------------------------------------------------#
@@ -34,13 +52,36 @@ import sys
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
+init_session(app)
 db.init_app(app)
+render_cache.init_app(app)
+home_snapshot.init_app(app)
+availability_index.init_app(app)
+recommender.init_app(app)
+instrumentation.init_app(app)
+thumbnail_index.init_app(app)
+assets.init_app(app)
 
 # connect to a local postgresql database
 migrate = Migrate(app, db)
 
+app.register_blueprint(api)
+app.register_blueprint(export)
+
 """Register CLI commands."""
 app.cli.add_command(seed)
+app.cli.add_command(refresh_facets)
+app.cli.add_command(roll_show_stats)
+app.cli.add_command(purge_sessions)
+app.cli.add_command(process_images)
+app.cli.add_command(queue_images)
+app.cli.add_command(build_assets)
+app.cli.add_command(export_command)
+app.cli.add_command(bench_show_plans)
+app.cli.add_command(bench_home)
+app.cli.add_command(bench_format)
+app.cli.add_command(bench_servers)
+app.cli.add_command(bench_routes)
 
 # ----------------------------------------------------------------------------#
 # Models.
@@ -52,15 +93,6 @@ app.cli.add_command(seed)
 # ----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
-
-
 app.jinja_env.filters['datetime'] = format_datetime
 
 # ----------------------------------------------------------------------------#
@@ -68,12 +100,66 @@ app.jinja_env.filters['datetime'] = format_datetime
 # ----------------------------------------------------------------------------#
 
 
+def seconds_until(moment):
+    return None if moment is None else (moment - request_now()).total_seconds()
+
+
+def form_timezone(default):
+    value = request.form.get('timezone') or default
+    if not valid_timezone(value):
+        raise ValueError('unknown timezone {!r}'.format(value))
+    return value
+
+
+def cached_details(kind, entity_id, load, details):
+    # (data dict, expiry) for a detail page. The entry expires when the next
+    # upcoming show starts, since that show then has to move to past_shows.
+    cached = render_cache.get(kind, entity_id, 'data')
+    if cached is None:
+        entity = load(entity_id)
+        cached = (details(entity), next_upcoming_start(entity.shows))
+        render_cache.set(kind, entity_id, 'data', cached, seconds_until(cached[1]))
+    return cached
+
+
+def render_detail(kind, entity_id, load, details, template):
+    # Pending flash messages and non-default date preferences are rendered
+    # into the page, so such a response is neither served from nor stored in
+    # the page cache.
+    use_page_cache = '_flashes' not in session and default_preferences()
+    if use_page_cache:
+        page = render_cache.get(kind, entity_id, 'page')
+        if page is not None:
+            return page
+
+    data, expires_at = cached_details(kind, entity_id, load, details)
+    page = render_template(template, **{kind: data})
+    if use_page_cache:
+        render_cache.set(kind, entity_id, 'page', page, seconds_until(expires_at))
+    return page
+
+
+def invalidate_venue(venue_id):
+    # artist pages show the venue name and image of their shows
+    render_cache.invalidate('venue', venue_id)
+    render_cache.invalidate('artist', *venue_artist_ids(venue_id))
+
+
+def invalidate_artist(artist_id):
+    render_cache.invalidate('artist', artist_id)
+    render_cache.invalidate('venue', *artist_venue_ids(artist_id))
+
+
+def page_size():
+    per_page = request.args.get('per_page', app.config['PAGE_SIZE'], type=int)
+    return min(max(per_page, 1), app.config['MAX_PAGE_SIZE'])
+
+
 @app.route('/')
 def index():
-    # return render_template('pages/home.html')
-    recentVenues = Venue.query.order_by(db.desc(Venue.id)).limit(10).all()
-    recentArtists = Artist.query.order_by(db.desc(Artist.id)).limit(10).all()
-    return render_template('pages/home.html', venues=recentVenues, artists=recentArtists)
+    # recent venues/artists and this week's shows come from a precomputed
+    # snapshot that the write paths keep up to date
+    return render_template('pages/home.html', **home_snapshot.get())
 
 
 #  Venues
@@ -82,41 +168,33 @@ def index():
 @app.route('/venues')
 def venues():
 
-    #  num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-    distinct_venues = [
-        v.city_and_state for v in Venue.query.distinct(Venue.city, Venue.state).all()
-    ]
-    venue_loc = []
-    for distinct_venue in distinct_venues:
-        venues = [{'id': v.id, 'name': v.name, 'num_upcoming_shows': v.shows}
-                  for v in Venue.query.filter_by(city=distinct_venue['city']).all()]
-        venue_loc.append({**distinct_venue, 'venues': venues})
-    return render_template('pages/venues.html', areas=venue_loc)
+    #  one keyset page of city/state areas, then the venues of those areas;
+    #  num_upcoming_shows comes from venue_stats.
+    try:
+        page = keyset_page(
+            venue_areas_query(), [Venue.state, Venue.city],
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            per_page=app.config['AREAS_PER_PAGE']
+        )
+    except ValueError:
+        abort(400)
+    return render_template('pages/venues.html', areas=venues_by_area(page.items), page=page)
 
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-    # implement search on artists with partial string search. Ensure it is case-insensitive.
+    # partial, case-insensitive search on name, city and genres.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
     try:
         search_term = request.form.get('search_term', '')
+        response = search(Venue, search_term, app.config['SEARCH_RESULTS_LIMIT'])
 
-        search_ven = Venue.query.filter(
-            Venue.name.ilike(f'%{search_term}%')).all()
-        response = {
-            "count": len(search_ven),
-            "data": [{
-                "id": v_search.id,
-                "name": v_search.name,
-                "num_upcoming_shows": len(db.session.query(Show).filter(Show.venue_id == v_search.id).filter(Show.start_time > datetime.now()).all())
-            } for v_search in search_ven]
-        }
-
-        return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+        return render_template('pages/search_venues.html', results=response, search_term=search_term)
     except:
         flash('An error occurred while searching, please try again')
-        print(sys.exc_info())
+        app.logger.exception('Venue search failed')
         return redirect(url_for('venues'))
 
 
@@ -125,55 +203,13 @@ def show_venue(venue_id):
     # shows the venue page with the given venue_id
 
     try:
-        venue = Venue.query.filter_by(id=venue_id).first()
-
-        upcoming_shows_query = db.session.query(Show).join(Artist).filter(
-            Show.venue_id == venue_id).filter(Show.start_time > datetime.now()).all()
-        upcoming_shows = []
-        for show in upcoming_shows_query:
-            upcoming_shows.append({
-                "artist_id": show.artist_id,
-                "artist_name": show.artist.name,
-                "artist_image_link": show.artist.image_link,
-                "start_time": show.start_time.strftime("%Y-%m-%d %H:%M:%S")
-            })
-
-        past_shows_query = db.session.query(Show).join(Artist).filter(
-            Show.venue_id == venue_id).filter(Show.start_time < datetime.now()).all()
-        past_shows = []
+        return render_detail('venue', venue_id, get_venue_with_shows,
+                             lambda venue: venue.full_venue_details,
+                             'pages/show_venue.html')
 
-        for show in past_shows_query:
-            past_shows.append({
-                "artist_id": show.artist_id,
-                "artist_name": show.artist.name,
-                "artist_image_link": show.artist.image_link,
-                "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-            })
-
-        data = {
-            "id": venue.id,
-            "name": venue.name,
-            "genres": venue.genres,
-            "address": venue.address,
-            "city": venue.city,
-            "state": venue.state,
-            "phone": venue.phone,
-            "website": venue.website,
-            "facebook_link": venue.facebook_link,
-            "seeking_talent": venue.seeking_talent,
-            "seeking_description": venue.seeking_description,
-            "image_link": venue.image_link,
-            "past_shows": past_shows,
-            "upcoming_shows": upcoming_shows,
-            "past_shows_count": len(past_shows),
-            "upcoming_shows_count": len(upcoming_shows),
-        }
-
-        return render_template('pages/show_venue.html', venue=data)
-
-    except Exception as err:
-        flash('Sorry, venue is not available!', err)
-        print(sys.exc_info())
+    except Exception:
+        flash('Sorry, venue is not available!')
+        app.logger.exception('Could not show venue %s', venue_id)
         return redirect(url_for('index'))
 
 
@@ -202,16 +238,21 @@ def create_venue_submission():
             facebook_link=request.form.get('facebook_link'),
             image_link=request.form.get('image_link'),
             website=request.form.get('website'),
+            timezone=form_timezone('UTC'),
             seeking_talent=request.form.get('seeking_talent') == 'True',
             seeking_description=request.form.get('seeking_description')
         )
         db.session.add(new_venue)
+        update_facet_counts('venues', after=facet_values('venues', new_venue))
+        enqueue_images(new_venue.image_link)
         db.session.commit()
-    except Exception as err:
-        print('An error occured while trying to create venue', err)
+        render_cache.invalidate('venue', new_venue.id)
+        home_snapshot.venue_saved(new_venue)
+        recommender.venue_saved(new_venue)
+    except Exception:
+        app.logger.exception('Could not create venue')
         error = True
         db.session.rollback()
-        print(sys.exc_info())
     finally:
         db.session.close()
 
@@ -229,17 +270,27 @@ def create_venue_submission():
 @app.route('/venues/<venue_id>/delete', methods=['POST'])
 def delete_venue(venue_id):
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-    venue_name = Venue.query.get(venue_id).name
+    venue = Venue.query.get(venue_id)
+    venue_name = venue.name
     try:
+        artist_ids = venue_artist_ids(venue_id)
+        update_facet_counts('venues', before=facet_values('venues', venue))
         venue_to_be_deleted = db.session.query(
             Venue).filter(Venue.id == venue_id)
         venue_to_be_deleted.delete()
+        # the venue's shows went with it (ON DELETE CASCADE)
+        recompute_stats('artists', artist_ids)
         db.session.commit()
+        render_cache.invalidate('venue', venue_id)
+        render_cache.invalidate('artist', *artist_ids)
+        home_snapshot.invalidate()
+        availability_index.venue_deleted(venue_id)
+        recommender.venue_deleted(venue_id)
         flash("Venue: " + venue_name + " was successfully deleted.")
 
     except:
         db.session.rollback()
-        print(sys.exc_info())
+        app.logger.exception('Could not delete venue %s', venue_id)
         return jsonify(
             {
                 "errorMessage": "Something went wrong. This venue was not successfully deleted. Please try again."
@@ -250,14 +301,80 @@ def delete_venue(venue_id):
         db.session.close()
         return redirect(url_for("index"))
 
+def facet_links(filters, summary):
+    # each facet value with its count and a link that toggles it
+    links = {}
+    for facet, values in summary.items():
+        links[facet] = []
+        for value, count in values:
+            if facet == 'genre':
+                selected = value in filters['genre']
+                genres = [g for g in filters['genre'] if g != value] if selected \
+                    else filters['genre'] + [value]
+                params = dict(filters, genre=genres)
+            else:
+                selected = filters[facet] == value
+                params = dict(filters, **{facet: None if selected else value})
+            links[facet].append({
+                'value': value,
+                'count': count,
+                'selected': selected,
+                'url': url_for(request.endpoint, **params),
+            })
+    return links
+
+
+def browse(kind):
+    filters = parse_filters(request.args)
+    model = FACET_KINDS[kind][0]
+    try:
+        page = keyset_page(
+            filtered_query(kind, filters), [model.id],
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            per_page=page_size()
+        )
+    except ValueError:
+        abort(400)
+    summary = facet_summary(kind, app.config['FACET_VALUES_LIMIT'])
+    return render_template(
+        'pages/browse.html',
+        kind=kind,
+        items=page.items,
+        page=page,
+        filters=filters,
+        facets=facet_links(filters, summary),
+        total=matching_total(kind, summary, filters),
+    )
+
+
+@app.route('/venues/browse')
+def browse_venues():
+    return browse('venues')
+
 #  Artists
 #  ----------------------------------------------------------------
 
 
 @app.route('/artists')
 def artists():
-    data = [a.artist_basic_details for a in Artist.query.all()]
-    return render_template('pages/artists.html', artists=data)
+    try:
+        page = keyset_page(
+            db.session.query(Artist.id, Artist.name),
+            [Artist.name, Artist.id],
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            per_page=page_size()
+        )
+    except ValueError:
+        abort(400)
+    data = [{'id': a.id, 'name': a.name} for a in page.items]
+    return render_template('pages/artists.html', artists=data, page=page)
+
+
+@app.route('/artists/browse')
+def browse_artists():
+    return browse('artists')
 
 
 @app.route('/artists/search', methods=['POST'])
@@ -265,24 +382,13 @@ def search_artists():
 
     try:
         search_term = request.form.get('search_term', '')
+        response = search(Artist, search_term, app.config['SEARCH_RESULTS_LIMIT'])
 
-        search_artist = Venue.query.filter(
-            Venue.name.ilike(f'%{search_term}%')).all()
-
-        response = {
-            "count": len(search_artist),
-            "data": [{
-                "id": v_search.id,
-                "name": v_search.name,
-                "num_upcoming_shows": len(db.session.query(Show).filter(Show.artist_id == v_search.id).filter(Show.start_time > datetime.now()).all())
-            } for v_search in search_artist]
-        }
-
-        return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+        return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
     except:
         flash('An error occurred while searching, please try again')
-        print(sys.exc_info)
+        app.logger.exception('Artist search failed')
         return redirect(url_for('artists'))
 
 
@@ -290,55 +396,13 @@ def search_artists():
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
     try:
-        artist = Artist.query.filter_by(id=artist_id).first()
-
-        past_shows_query = db.session.query(Show).join(Venue).filter(
-            Show.artist_id == artist_id).filter(Show.start_time > datetime.now()).all()
-        past_shows = []
-
-        for show in past_shows_query:
-            past_shows.append({
-                "venue_id": show.venue_id,
-                "venue_name": show.venue.name,
-                "artist_image_link": show.venue.image_link,
-                "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-            })
-
-        upcoming_shows_query = db.session.query(Show).join(Venue).filter(
-            Show.artist_id == artist_id).filter(Show.start_time > datetime.now()).all()
-        upcoming_shows = []
+        return render_detail('artist', artist_id, get_artist_with_shows,
+                             lambda artist: artist.full_artist_details,
+                             'pages/show_artist.html')
 
-        for show in upcoming_shows_query:
-            upcoming_shows.append({
-                "venue_id": show.venue_id,
-                "venue_name": show.venue.name,
-                "artist_image_link": show.venue.image_link,
-                "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-            })
-
-        data = {
-            "id": artist.id,
-            "name": artist.name,
-            "genres": artist.genres,
-            "city": artist.city,
-            "state": artist.state,
-            "phone": artist.phone,
-            "website": artist.website,
-            "facebook_link": artist.facebook_link,
-            "seeking_venue": artist.seeking_venue,
-            "seeking_description": artist.seeking_description,
-            "image_link": artist.image_link,
-            "past_shows": past_shows,
-            "upcoming_shows": upcoming_shows,
-            "past_shows_count": len(past_shows),
-            "upcoming_shows_count": len(upcoming_shows),
-        }
-
-        return render_template('pages/show_artist.html', artist=data)
-
-    except Exception as err:
-        flash('Sorry, artist is not available!', err)
-        print(sys.exc_info())
+    except Exception:
+        flash('Sorry, artist is not available!')
+        app.logger.exception('Could not show artist %s', artist_id)
         return redirect(url_for('index'))
 
 
@@ -362,7 +426,6 @@ def edit_artist(artist_id):
         seeking_venue=artist.seeking_venue,
         seeking_description=artist.seeking_description
     )
-    print(sys.exc_info())
     # populate form with fields from artist with ID <artist_id>
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
@@ -373,6 +436,7 @@ def edit_artist_submission(artist_id):
     # artist record with ID <artist_id> using the new attributes
     try:
         artist = Artist.query.filter_by(id=artist_id).all()[0]
+        before = facet_values('artists', artist)
 
         artist.name = request.form.get('name')
         artist.city = request.form.get('city')
@@ -386,10 +450,15 @@ def edit_artist_submission(artist_id):
         artist.seeking_description = request.form.get('seeking_description')
 
         db.session.add(artist)
+        update_facet_counts('artists', before, facet_values('artists', artist))
+        enqueue_images(artist.image_link)
         db.session.commit()
+        invalidate_artist(artist_id)
+        home_snapshot.artist_saved(artist)
+        recommender.artist_saved(artist)
     except:
         db.session.rollback()
-        print(sys.exc_info())
+        app.logger.exception('Could not update artist %s', artist_id)
         flash('An error occurred. Artist could not be updated')
     finally:
         db.session.close()
@@ -411,6 +480,7 @@ def edit_venue(venue_id):
         facebook_link=venue.facebook_link,
         website=venue.website,
         image_link=venue.image_link,
+        timezone=venue.timezone,
         seeking_talent=venue.seeking_talent,
         seeking_description=venue.seeking_description
     )
@@ -424,6 +494,7 @@ def edit_venue_submission(venue_id):
     # venue record with ID <venue_id> using the new attributes
     try:
         venue = Venue.query.filter_by(id=venue_id).all()[0]
+        before = facet_values('venues', venue)
 
         venue.name = request.form.get('name')
         venue.city = request.form.get('city')
@@ -433,18 +504,24 @@ def edit_venue_submission(venue_id):
         venue.facebook_link = request.form.get('facebook_link')
         venue.website = request.form.get('website')
         venue.image_link = request.form.get('image_link')
+        venue.timezone = form_timezone(venue.timezone)
         venue.seeking_talent = request.form.get('seeking_talent') == 'True'
         venue.seeking_description = request.form.get('seeking_description')
 
         db.session.add(venue)
+        update_facet_counts('venues', before, facet_values('venues', venue))
+        enqueue_images(venue.image_link)
         db.session.commit()
+        invalidate_venue(venue_id)
+        home_snapshot.venue_saved(venue)
+        recommender.venue_saved(venue)
 
         db.session.refresh(venue)
         flash("This venue was successfully updated!")
 
     except:
         db.session.rollback()
-        print(sys.exc_info())
+        app.logger.exception('Could not update venue %s', venue_id)
         flash(
             "An error occurred. Venue "
             + request.form.get("name")
@@ -480,7 +557,7 @@ def create_artist_submission():
         #     'seeking_description') else False
         new_artist = Artist(
             name=request.form.get('name'),
-            genres=request.form.get('genres'),
+            genres=request.form.getlist('genres'),
             city=request.form.get('city'),
             state=request.form.get('state'),
             phone=request.form.get('phone'),
@@ -493,11 +570,16 @@ def create_artist_submission():
             # seeking_description=seeking_description,
         )
         db.session.add(new_artist)
+        update_facet_counts('artists', after=facet_values('artists', new_artist))
+        enqueue_images(new_artist.image_link)
         db.session.commit()
+        render_cache.invalidate('artist', new_artist.id)
+        home_snapshot.artist_saved(new_artist)
+        recommender.artist_saved(new_artist)
         # on successful db insert, flash success
         flash('Artist ' + request.form['name'] + ' was successfully created!')
-    except Exception as err:
-        print('**** error *****', err)
+    except Exception:
+        app.logger.exception('Could not create artist')
         error = True
         db.session.rollback()
         # on unsuccessful db insert, flash an error instead.
@@ -517,19 +599,29 @@ def create_artist_submission():
 
 @app.route('/shows')
 def shows():
-    # displays list of shows at /shows
-    shows_list = Show.query.all()
+    # displays list of shows at /shows, one keyset page at a time
+    try:
+        page = keyset_page(
+            Show.query.options(joinedload(Show.venue), joinedload(Show.artist)),
+            [Show.start_time, Show.id],
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            per_page=page_size()
+        )
+    except ValueError:
+        abort(400)
     data = []
-    for show in shows_list:
+    for show in page.items:
         data.append({
             "venue_id": show.venue_id,
             "venue_name": show.venue.name,
             "artist_id": show.artist_id,
             "artist_name": show.artist.name,
             "artist_image_link": show.artist.image_link,
-            "start_time": str(show.start_time)
+            "venue_timezone": show.venue.timezone,
+            "start_time": show.start_time
         })
-    return render_template('pages/shows.html', shows=data)
+    return render_template('pages/shows.html', shows=data, page=page)
 
 
 @app.route('/shows/create')
@@ -546,16 +638,17 @@ def create_show_submission():
     error = False
 
     try:
-        new_show = Show(
-            venue_id=request.form.get('venue_id'),
-            artist_id=request.form.get('artist_id'),
-            start_time=request.form.get('start_time'),
-        )
-        db.session.add(new_show)
-        db.session.commit()
-    except Exception as err:
-        print('An error occured while trying to create show:', err)
-        error = True
+        new_show = book_show(request.form)
+        render_cache.invalidate('venue', new_show.venue_id)
+        render_cache.invalidate('artist', new_show.artist_id)
+        home_snapshot.show_created(new_show)
+    except BookingConflict:
+        error = 'The venue or the artist is already booked at that time.'
+    except BookingError:
+        error = 'Check the venue, artist and start time of the show.'
+    except Exception:
+        app.logger.exception('Could not create show')
+        error = 'An error occurred. Show could not be listed.'
         db.session.rollback()
     finally:
         db.session.close()
@@ -564,12 +657,115 @@ def create_show_submission():
         flash('Show was successfully listed!')
         # on unsuccessful db insert, flash an error instead.
     else:
-        flash('An error occurred. Show could not be listed.')
+        flash(error)
 
         return redirect(url_for('index'))
     return render_template('pages/home.html')
 
 
+@app.route('/shows/batch', methods=['POST'])
+def create_show_batch():
+    # JSON list of {venue_id, artist_id, start_time[, duration]}, booked
+    # all-or-nothing in one transaction
+    bookings = request.get_json(silent=True)
+    if not isinstance(bookings, list) or not bookings:
+        return jsonify({'error': 'expected a non-empty JSON list of shows'}), 400
+    if len(bookings) > app.config['BOOKING_BATCH_LIMIT']:
+        return jsonify({'error': 'at most {} shows per batch'.format(
+            app.config['BOOKING_BATCH_LIMIT'])}), 400
+    try:
+        shows = book_shows(bookings)
+    except BookingConflict as err:
+        return jsonify({'error': str(err)}), 409
+    except BookingError as err:
+        return jsonify({'error': str(err)}), 400
+    finally:
+        db.session.close()
+
+    render_cache.invalidate('venue', *{show.venue_id for show in shows})
+    render_cache.invalidate('artist', *{show.artist_id for show in shows})
+    home_snapshot.invalidate()
+    return jsonify({'ids': [show.id for show in shows]}), 201
+
+
+def availability(kind):
+    # e.g. ?city=San Francisco&seeking=1&from=2026-11-01&to=2026-11-30&weekday=fri&at=20:00&duration=180
+    try:
+        query = parse_query(request.args)
+    except ValueError as err:
+        return jsonify({'error': 'invalid availability query: {}'.format(err)}), 400
+    return jsonify(free_slots(kind, **query))
+
+
+@app.route('/venues/availability')
+def venue_availability():
+    return availability('venues')
+
+
+@app.route('/artists/availability')
+def artist_availability():
+    return availability('artists')
+
+
+def recommendations(kind, entity_id):
+    limit = min(max(request.args.get('limit', 10, type=int), 1), app.config['MAX_PAGE_SIZE'])
+    data = recommender.recommend(kind, entity_id, limit)
+    if data is None:
+        abort(404)
+    return jsonify({'count': len(data), 'data': data})
+
+
+@app.route('/venues/<int:venue_id>/recommendations')
+def venue_recommendations(venue_id):
+    # artists for a venue
+    return recommendations('venues', venue_id)
+
+
+@app.route('/artists/<int:artist_id>/recommendations')
+def artist_recommendations(artist_id):
+    # venues for an artist
+    return recommendations('artists', artist_id)
+
+
+@app.route('/preferences', methods=['POST'])
+def set_preferences():
+    # locale/timezone used to show dates, e.g. locale=de_DE&timezone=Europe/Berlin;
+    # an empty value goes back to the default
+    for key, valid in (('locale', valid_locale), ('timezone', valid_timezone)):
+        if key not in request.form:
+            continue
+        value = request.form[key].strip()
+        if not value:
+            session.pop(key, None)
+        elif valid(value):
+            session[key] = value
+        else:
+            return jsonify({'error': 'unknown {}: {}'.format(key, value)}), 400
+    return jsonify({'locale': session.get('locale'), 'timezone': session.get('timezone')})
+
+
+@app.route('/images', methods=['POST'])
+def upload_image():
+    # multipart `image` file -> URL to use as a venue/artist image_link;
+    # thumbnails follow once a worker has processed it
+    if 'image' not in request.files:
+        return jsonify({'error': 'no image file'}), 400
+    try:
+        image_link = save_upload(request.files['image'])
+        db.session.commit()
+    except ImageError as err:
+        return jsonify({'error': str(err)}), 400
+    finally:
+        db.session.close()
+    return jsonify({'image_link': image_link}), 201
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    # hit/miss counters of this worker's render cache
+    return jsonify(render_cache.stats())
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
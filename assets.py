@@ -0,0 +1,206 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+from flask import request, send_from_directory, url_for
+
+
+# Static asset pipeline. `flask build_assets` concatenates the BUNDLES,
+# minifies what is not minified yet, copies every static file under a name
+# carrying its content hash, rewrites CSS url()s to those names and writes
+# gzip/brotli variants next to them, plus a manifest. /assets/ serves the
+# build with a one-year immutable Cache-Control and the best precompressed
+# variant the client accepts, so repeat visits make no asset requests.
+# Without a build (development) the helpers point at the source files.
+
+BUNDLES = {
+    'css/app.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css',
+                    'css/main.responsive.css', 'css/main.quickfix.css'],
+    'js/head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+    # in the order the deferred scripts used to run
+    'js/app.js': ['js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+}
+
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = {'.css', '.js', '.svg', '.ttf', '.otf', '.eot', '.map'}
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+IMMUTABLE = 365 * 24 * 3600
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+CSS_STRING = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')')
+# a string or a comment, whichever starts first
+CSS_STRING_OR_COMMENT = re.compile(CSS_STRING.pattern + r'|/\*.*?\*/', re.S)
+
+
+# Minification
+
+def minify_css(text):
+    # comments and whitespace only; strings are left untouched
+    text = CSS_STRING_OR_COMMENT.sub(lambda match: match.group(1) or '', text)
+    parts = CSS_STRING.split(text)
+    for i in range(0, len(parts), 2):
+        code = re.sub(r'\s+', ' ', parts[i])
+        parts[i] = re.sub(r'\s*([{};,>])\s*', r'\1', code).replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def minify_js(text):
+    # without a parser only whole-line comments, indentation and blank lines
+    # can go safely; newlines stay for automatic semicolon insertion
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+def minify(path, text):
+    if '.min.' in posixpath.basename(path):
+        return text
+    return minify_css(text) if path.endswith('.css') else minify_js(text)
+
+
+# Build
+
+def fingerprint(path, data):
+    root, extension = posixpath.splitext(path)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+
+
+def rewrite_css_urls(text, path, files):
+    # relative url()s point at the fingerprinted copies (or the original
+    # static URL for files that are not there)
+    def replace(match):
+        quote, target = match.groups()
+        if re.match(r'^([a-z]+:|/|#)', target):
+            return match.group(0)
+        clean = re.split(r'[?#]', target, 1)[0]
+        suffix = target[len(clean):]
+        resolved = posixpath.normpath(posixpath.join(posixpath.dirname(path), clean))
+        url = files.get(resolved, '/static/' + resolved)
+        return f'url({quote}{url}{suffix}{quote})'
+    return CSS_URL.sub(replace, text)
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def compress(path, data):
+    # precompressed variants that are actually smaller; [encoding, ...]
+    import brotli
+    variants = {
+        'br': brotli.compress(data, quality=11),
+        'gzip': gzip.compress(data, compresslevel=9, mtime=0),
+    }
+    written = []
+    for encoding, suffix in ENCODINGS:
+        if len(variants[encoding]) < len(data):
+            write(path + suffix, variants[encoding])
+            written.append(encoding)
+    return written
+
+
+def source_files(static_dir):
+    for root, dirs, names in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) !=
+                         os.path.join(static_dir, BUILD_DIR))
+        for name in sorted(names):
+            path = os.path.relpath(os.path.join(root, name), static_dir)
+            yield path.replace(os.sep, '/')
+
+
+def build(static_dir):
+    # -> manifest: {'files': {logical path: built path}, 'encodings': {built path: [...]}}
+    build_dir = os.path.join(static_dir, BUILD_DIR)
+    shutil.rmtree(build_dir, ignore_errors=True)
+    files, encodings, contents = {}, {}, {}
+
+    def emit(path, data):
+        built = fingerprint(path, data)
+        target = os.path.join(build_dir, built)
+        write(target, data)
+        files[path] = built
+        if posixpath.splitext(path)[1] in COMPRESSIBLE:
+            encodings[built] = compress(target, data)
+
+    # plain files first, so stylesheets can refer to their built names
+    for path in source_files(static_dir):
+        with open(os.path.join(static_dir, path), 'rb') as f:
+            contents[path] = f.read()
+        if not path.endswith('.css'):
+            emit(path, contents[path])
+    urls = {path: f'/assets/{built}' for path, built in files.items()}
+    for path, data in contents.items():
+        if path.endswith('.css'):
+            text = rewrite_css_urls(minify(path, data.decode('utf-8')), path, urls)
+            emit(path, text.encode('utf-8'))
+    for bundle, members in BUNDLES.items():
+        texts = []
+        for member in members:
+            text = minify(member, contents[member].decode('utf-8'))
+            if member.endswith('.css'):
+                text = rewrite_css_urls(text, member, urls)
+            texts.append(text)
+        separator = '\n' if bundle.endswith('.css') else ';\n'
+        emit(bundle, separator.join(texts).encode('utf-8'))
+
+    manifest = {'files': files, 'encodings': encodings}
+    write(os.path.join(build_dir, MANIFEST), json.dumps(manifest, indent=1).encode())
+    return manifest
+
+
+# Serving
+
+class Assets:
+    def __init__(self):
+        self.manifest = None
+        self.build_dir = None
+
+    def init_app(self, app):
+        self.build_dir = os.path.join(app.static_folder, BUILD_DIR)
+        self.load()
+        app.jinja_env.globals['asset_url'] = self.url
+        app.jinja_env.globals['asset_urls'] = self.urls
+        app.add_url_rule('/assets/<path:filename>', 'asset', self.send)
+
+    def load(self):
+        try:
+            with open(os.path.join(self.build_dir, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = None
+
+    def url(self, path):
+        if self.manifest and path in self.manifest['files']:
+            return url_for('asset', filename=self.manifest['files'][path])
+        return url_for('static', filename=path)
+
+    def urls(self, path):
+        # a bundle is one built file, or its members when there is no build
+        if self.manifest is None and path in BUNDLES:
+            return [url_for('static', filename=member) for member in BUNDLES[path]]
+        return [self.url(path)]
+
+    def send(self, filename):
+        accepted = self.manifest and self.manifest['encodings'].get(filename) or ()
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted and request.accept_encodings[encoding] > 0:
+                response = send_from_directory(
+                    self.build_dir, filename + suffix,
+                    mimetype=mimetypes.guess_type(filename)[0], max_age=IMMUTABLE)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.build_dir, filename, max_age=IMMUTABLE)
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE}, immutable'
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+assets = Assets()
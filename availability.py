@@ -0,0 +1,269 @@
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from flask import current_app
+from sqlalchemy.dialects import postgresql
+
+from formatting import timezone
+from model import (db, Show, Venue, Artist, DEFAULT_SHOW_DURATION,
+                   request_now, show_end_time, show_period)
+
+
+# Availability of many venues or artists over a date range. Candidate slots
+# are one period per matching day (e.g. every Friday 20:00 for 3 hours).
+# free_slots_sql() anti-joins generated slots against the shows table, each
+# probe served by the (entity, period) GiST index of the exclusion
+# constraints. AvailabilityIndex keeps the upcoming booked periods in memory
+# for repeated queries and answers each slot with a bisect. Bookings are
+# inserted into it as they are made; loading and the periodic reload run in
+# a background thread, and queries go to SQL until the first load is done.
+# Slot times are local to each venue (artists use DEFAULT_TIMEZONE).
+
+KINDS = {
+    'venues': (Venue, Show.venue_id, 'seeking_talent'),
+    'artists': (Artist, Show.artist_id, 'seeking_venue'),
+}
+
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+MAX_RANGE = timedelta(days=366)
+
+# bounds the distance between a local slot time and the UTC instant it maps to
+MAX_UTC_OFFSET = timedelta(hours=14)
+
+
+def parse_query(args):
+    # request args -> keyword arguments of free_slots(); ValueError if invalid
+    if 'from' not in args or 'to' not in args:
+        raise ValueError('from and to dates are required')
+    start = date.fromisoformat(args['from'])
+    end = date.fromisoformat(args['to'])
+    if not start <= end or end - start > MAX_RANGE:
+        raise ValueError('to must be within a year after from')
+    weekdays = [
+        int(day) if day.isdigit() else
+        WEEKDAYS.index(day[:3].lower()) if day[:3].lower() in WEEKDAYS else -1
+        for day in args.getlist('weekday')
+    ]
+    if any(not 0 <= day < 7 for day in weekdays):
+        raise ValueError('weekday must be 0-6 or mon-sun')
+    duration = int(args.get('duration', DEFAULT_SHOW_DURATION))
+    if duration <= 0:
+        raise ValueError('duration must be positive')
+    seeking = args.get('seeking')
+    return {
+        'start': start,
+        'end': end,
+        'at': time.fromisoformat(args.get('at', '20:00')),
+        'duration': duration,
+        'weekdays': weekdays,
+        'city': args.get('city'),
+        'state': args.get('state'),
+        'genre': args.get('genre'),
+        'seeking': None if seeking is None else seeking.lower() in ('1', 'true', 'yes'),
+    }
+
+
+def candidate_slots(start, end, at, weekdays):
+    day = start
+    while day <= end:
+        if not weekdays or day.weekday() in weekdays:
+            yield datetime.combine(day, at)
+        day += timedelta(days=1)
+
+
+def timezone_column(model):
+    if hasattr(model, 'timezone'):
+        return model.timezone
+    return db.literal(current_app.config['DEFAULT_TIMEZONE'])
+
+
+def candidates(kind, city=None, state=None, genre=None, seeking=None):
+    model, _, seeking_column = KINDS[kind]
+    query = db.session.query(model.id, model.name,
+                             timezone_column(model).label('timezone'))
+    if city:
+        query = query.filter(db.func.lower(model.city) == city.lower())
+    if state:
+        query = query.filter(model.state == state)
+    if genre:
+        query = query.filter(model.genres.op('@>')(
+            db.cast(postgresql.array([genre]), postgresql.ARRAY(db.String))))
+    if seeking is not None:
+        query = query.filter(getattr(model, seeking_column) == seeking)
+    return query
+
+
+def group_slots(rows):
+    # (id, name, timezone, slot) rows ordered by id -> result payload; slots
+    # are given with the entity's own offset, whichever path found them
+    entities = {}
+    for entity_id, name, zone, slot in rows:
+        entity = entities.setdefault(
+            entity_id, {'id': entity_id, 'name': name, 'free': []})
+        entity['free'].append(slot.astimezone(timezone(zone)).isoformat())
+    return {'count': len(entities), 'data': list(entities.values())}
+
+
+def free_slots_sql(kind, start, end, at, duration, weekdays=(), **filters):
+    _, show_column, _ = KINDS[kind]
+    length = timedelta(minutes=duration)
+    entities = candidates(kind, **filters).subquery()
+    # local slot times, placed in each entity's timezone
+    slot = db.func.generate_series(
+        datetime.combine(start, at), datetime.combine(end, at),
+        timedelta(days=1), type_=db.DateTime
+    ).column_valued('slot')
+    starts_at = db.func.timezone(entities.c.timezone, slot,
+                                 type_=db.DateTime(timezone=True))
+    booked = db.session.query(Show.id).filter(
+        show_column == entities.c.id,
+        show_period().op('&&')(db.func.tstzrange(starts_at, starts_at + length))
+    )
+    query = db.session.query(
+        entities.c.id, entities.c.name, entities.c.timezone, starts_at
+    ).filter(~booked.exists())
+    if weekdays:
+        # isodow is 1 (Monday) to 7, date.weekday() is 0 to 6
+        query = query.filter(db.extract('isodow', slot).in_(
+            [day + 1 for day in weekdays]))
+    return group_slots(query.order_by(entities.c.id, slot).all())
+
+
+class AvailabilityIndex:
+    def __init__(self, horizon_days=365, max_age=60):
+        self.horizon = timedelta(days=horizon_days)
+        self.max_age = timedelta(seconds=max_age)
+        self.lock = threading.Lock()
+        self.app = None
+        self.periods = {}
+        # kind: periods booked while that kind is being reloaded
+        self.reloading = {}
+
+    def init_app(self, app):
+        self.app = app
+        self.horizon = timedelta(days=app.config.get(
+            'AVAILABILITY_HORIZON_DAYS', self.horizon.days))
+        self.max_age = timedelta(seconds=app.config.get(
+            'AVAILABILITY_INDEX_MAX_AGE', self.max_age.total_seconds()))
+
+    def current(self, kind):
+        # the loaded index of `kind` or None; a missing or stale one is
+        # reloaded in the background while requests keep using what is there
+        now = request_now()
+        with self.lock:
+            entry = self.periods.get(kind)
+            stale = entry is None or entry['expired'] or now - entry['loaded_at'] > self.max_age
+            if stale and kind not in self.reloading:
+                self.reloading[kind] = []
+                threading.Thread(target=self.reload, args=(kind,), daemon=True).start()
+            return entry
+
+    def reload(self, kind):
+        try:
+            with self.app.app_context():
+                entry = self.build(kind, request_now())
+        except Exception:
+            self.app.logger.exception('Could not load the %s availability index', kind)
+            with self.lock:
+                del self.reloading[kind]
+            return
+        with self.lock:
+            # bookings made while the shows were being read may be missing
+            for entity_id, starts_at, ends_at in self.reloading.pop(kind):
+                self.insert(entry, entity_id, starts_at, ends_at)
+            self.periods[kind] = entry
+
+    def build(self, kind, now):
+        # {entity_id: (starts, ends)} of the periods up to loaded_at + horizon
+        _, show_column, _ = KINDS[kind]
+        end_time = show_end_time()
+        rows = db.session.query(show_column, Show.start_time, end_time).filter(
+            end_time > now, Show.start_time < now + self.horizon
+        ).order_by(show_column, Show.start_time).all()
+        periods = defaultdict(lambda: ([], []))
+        for entity_id, starts_at, ends_at in rows:
+            starts, ends = periods[entity_id]
+            starts.append(starts_at)
+            ends.append(ends_at)
+        return {'loaded_at': now, 'expired': False, 'periods': dict(periods)}
+
+    def insert(self, entry, entity_id, starts_at, ends_at):
+        if ends_at <= entry['loaded_at'] or starts_at >= entry['loaded_at'] + self.horizon:
+            return
+        starts, ends = entry['periods'].setdefault(entity_id, ([], []))
+        i = bisect_right(starts, starts_at)
+        if i and starts[i - 1] == starts_at:
+            return
+        starts.insert(i, starts_at)
+        ends.insert(i, ends_at)
+
+    @staticmethod
+    def is_free(periods, entity_id, slot_start, slot_end):
+        # an entity's periods never overlap, so ends are sorted like starts
+        # and only the last period starting before slot_end can clash
+        starts, ends = periods.get(entity_id, ((), ()))
+        i = bisect_left(starts, slot_end)
+        return i == 0 or ends[i - 1] <= slot_start
+
+    def covers(self, entry, slots, length):
+        # the index reaches loaded_at + horizon; slots are local times,
+        # loaded_at and now are UTC
+        now = request_now().replace(tzinfo=None)
+        reach = (entry['loaded_at'] + self.horizon).replace(tzinfo=None)
+        return not slots or (now <= slots[0] - MAX_UTC_OFFSET and
+                             slots[-1] + MAX_UTC_OFFSET + length <= reach)
+
+    def free_slots(self, entry, kind, start, end, at, duration, weekdays=(), **filters):
+        model = KINDS[kind][0]
+        length = timedelta(minutes=duration)
+        slots = list(candidate_slots(start, end, at, weekdays))
+        periods = entry['periods']
+        local_slots = {}
+        rows = []
+        for entity_id, name, zone in candidates(kind, **filters).order_by(model.id).all():
+            if zone not in local_slots:
+                local_slots[zone] = [timezone(zone).localize(slot) for slot in slots]
+            with self.lock:
+                rows.extend(
+                    (entity_id, name, zone, slot) for slot in local_slots[zone]
+                    if self.is_free(periods, entity_id, slot, slot + length))
+        return group_slots(rows)
+
+    # Updates, called by the write paths after a commit.
+
+    def booked(self, shows):
+        with self.lock:
+            for kind, (_, show_column, _) in KINDS.items():
+                entry = self.periods.get(kind)
+                for show in shows:
+                    period = (getattr(show, show_column.key), show.start_time, show.end_time)
+                    if entry is not None:
+                        self.insert(entry, *period)
+                    if kind in self.reloading:
+                        self.reloading[kind].append(period)
+
+    def venue_deleted(self, venue_id):
+        # its shows went with it; the artists' side is reloaded to free them
+        with self.lock:
+            entry = self.periods.get('venues')
+            if entry is not None:
+                entry['periods'].pop(int(venue_id), None)
+            if 'artists' in self.periods:
+                self.periods['artists']['expired'] = True
+
+
+availability_index = AvailabilityIndex()
+
+
+def free_slots(kind, **query):
+    # the in-memory index only covers the upcoming horizon
+    slots = list(candidate_slots(query['start'], query['end'],
+                                 query['at'], query['weekdays']))
+    length = timedelta(minutes=query['duration'])
+    entry = availability_index.current(kind)
+    if entry is not None and availability_index.covers(entry, slots, length):
+        return availability_index.free_slots(entry, kind, **query)
+    return free_slots_sql(kind, **query)
@@ -0,0 +1,554 @@
+import contextlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import click
+from datetime import datetime, timedelta
+from flask import current_app, render_template, url_for
+from flask.cli import with_appcontext
+from sqlalchemy.dialects import postgresql
+
+from command import CITIES, GENRES
+
+
+# Benchmarks run against the configured database. Synthetic rows are
+# inserted inside a transaction that is rolled back at the end, so they
+# leave the data untouched.
+
+
+SHOW_INDEXES = [
+    'ix_shows_venue_id_start_time',
+    'ix_shows_artist_id_start_time',
+    'ix_shows_start_time_id',
+    'ix_venues_genres',
+]
+
+
+def insert_synthetic_rows(conn, venues, artists, shows):
+    # statements go straight to psycopg2, hence the doubled %% operators
+    genres = "(ARRAY['Jazz', 'Rock n Roll', 'Folk', 'Blues', 'Hip-Hop'])"
+    venue_ids = [row[0] for row in conn.exec_driver_sql(f'''
+        INSERT INTO venues (name, city, state, address, phone, genres,
+                            image_link, seeking_talent, seeking_description)
+        SELECT 'bench venue ' || g, 'City ' || g %% 200, 'CA', 'Address', '555-0000',
+               ARRAY[{genres}[1 + g %% 5]]::varchar[], 'https://via.placeholder.com',
+               g %% 2 = 0, 'bench'
+        FROM generate_series(1, %(n)s) AS g
+        RETURNING id''', {'n': venues})]
+    artist_ids = [row[0] for row in conn.exec_driver_sql(f'''
+        INSERT INTO artists (name, city, state, phone, genres,
+                             image_link, seeking_venue, seeking_description)
+        SELECT 'bench artist ' || g, 'City ' || g %% 200, 'CA', '555-0000',
+               ARRAY[{genres}[1 + g %% 5]]::varchar[], 'https://via.placeholder.com',
+               g %% 2 = 0, 'bench'
+        FROM generate_series(1, %(n)s) AS g
+        RETURNING id''', {'n': artists})]
+    # consecutive runs of `venues` shows share a 3-hour slot, centred on now;
+    # with venues <= artists no venue or artist is booked twice in a slot
+    conn.exec_driver_sql('''
+        INSERT INTO shows (venue_id, artist_id, start_time)
+        SELECT (%(venue_ids)s)[1 + g %% %(venues)s],
+               (%(artist_ids)s)[1 + g %% %(artists)s],
+               now() + (g / %(venues)s - %(n)s / %(venues)s / 2) * interval '3 hours'
+        FROM generate_series(0, %(n)s - 1) AS g''', {
+        'venue_ids': venue_ids, 'venues': len(venue_ids),
+        'artist_ids': artist_ids, 'artists': len(artist_ids), 'n': shows,
+    })
+    conn.exec_driver_sql('ANALYZE venues, artists, shows')
+    return venue_ids, artist_ids
+
+
+def hot_path_queries(venue_id, artist_id, venue_ids):
+    from model import db, Show, Venue, request_now
+    now = request_now()
+    return {
+        'venue past shows': db.select(Show).where(
+            Show.venue_id == venue_id, Show.start_time < now),
+        'artist upcoming shows': db.select(Show).where(
+            Show.artist_id == artist_id, Show.start_time > now),
+        'upcoming counts': db.select(Show.venue_id, db.func.count(Show.id)).where(
+            Show.venue_id.in_(venue_ids), Show.start_time > now
+        ).group_by(Show.venue_id),
+        'shows listing page': db.select(Show).order_by(
+            Show.start_time, Show.id).limit(30),
+        'venues by genre': db.select(Venue.id).where(
+            Venue.genres.op('@>')(db.cast(postgresql.array(['Jazz']),
+                                          postgresql.ARRAY(db.String)))),
+    }
+
+
+def explain(conn, statement):
+    compiled = statement.compile(dialect=postgresql.dialect(),
+                                 compile_kwargs={'render_postcompile': True})
+    plan = conn.exec_driver_sql(
+        'EXPLAIN (ANALYZE, FORMAT JSON) ' + str(compiled), compiled.params
+    ).scalar()[0]
+
+    nodes = []
+
+    def walk(node):
+        if 'Relation Name' in node or 'Index Name' in node:
+            nodes.append('{} on {}'.format(
+                node['Node Type'],
+                node.get('Index Name') or node['Relation Name']))
+        for child in node.get('Plans', []):
+            walk(child)
+    walk(plan['Plan'])
+    return nodes, plan['Execution Time']
+
+
+def report_plans(conn, queries):
+    for name, statement in queries.items():
+        nodes, ms = explain(conn, statement)
+        click.echo(f'  {name:<24} {ms:9.2f} ms  {", ".join(nodes)}')
+
+
+@click.command('bench_show_plans')
+@click.option('--venues', default=2000, show_default=True)
+@click.option('--artists', default=5000, show_default=True)
+@click.option('--shows', default=500000, show_default=True)
+@with_appcontext
+def bench_show_plans(venues, artists, shows):
+    """Compare show hot-path query plans with and without the indexes."""
+    from model import db
+    if venues > artists:
+        raise click.BadParameter('must not exceed --artists', param_hint='--venues')
+
+    with db.engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            click.echo(f'Inserting {venues} venues, {artists} artists, {shows} shows...')
+            venue_ids, artist_ids = insert_synthetic_rows(
+                conn, venues, artists, shows)
+            queries = hot_path_queries(
+                venue_ids[0], artist_ids[0], venue_ids[:50])
+
+            click.echo('With indexes:')
+            report_plans(conn, queries)
+
+            for index in SHOW_INDEXES:
+                conn.exec_driver_sql(f'DROP INDEX IF EXISTS {index}')
+            click.echo('Without indexes:')
+            report_plans(conn, queries)
+        finally:
+            trans.rollback()
+
+
+def requests_per_second(view, count):
+    with current_app.test_request_context('/'):
+        view()  # warm up caches and the template
+        started = time.perf_counter()
+        for _ in range(count):
+            view()
+        return count / (time.perf_counter() - started)
+
+
+def legacy_index():
+    # the home page as it was before the snapshot: queried on every request
+    from model import (db, Venue, Artist, venue_upcoming_show_counts,
+                       artist_upcoming_show_counts)
+    recent_venues = Venue.query.order_by(db.desc(Venue.id)).limit(10).all()
+    recent_artists = Artist.query.order_by(db.desc(Artist.id)).limit(10).all()
+    venue_counts = venue_upcoming_show_counts(v.id for v in recent_venues)
+    artist_counts = artist_upcoming_show_counts(a.id for a in recent_artists)
+    venues = [{'id': v.id, 'name': v.name, 'num_upcoming_shows': venue_counts[v.id]}
+              for v in recent_venues]
+    artists = [{'id': a.id, 'name': a.name, 'num_upcoming_shows': artist_counts[a.id]}
+               for a in recent_artists]
+    return render_template('pages/home.html', venues=venues, artists=artists)
+
+
+@click.command('bench_home')
+@click.option('--requests', 'count', default=500, show_default=True)
+@with_appcontext
+def bench_home(count):
+    """Requests per second of the home page, queried vs snapshot."""
+    queried = requests_per_second(legacy_index, count)
+    snapshot = requests_per_second(current_app.view_functions['index'], count)
+    click.echo(f'queried:  {queried:8.1f} req/s')
+    click.echo(f'snapshot: {snapshot:8.1f} req/s  ({snapshot / queried:.1f}x)')
+
+
+def legacy_format_datetime(value, format='medium'):
+    # the datetime filter before formatting.py: a string, parsed on every call
+    import babel.dates
+    import dateutil.parser
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def microseconds_per_call(call, values, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for value in values:
+            call(value)
+    return (time.perf_counter() - started) / (rounds * len(values)) * 1e6
+
+
+@click.command('bench_format')
+@click.option('--tiles', default=1000, show_default=True, help='Distinct show times.')
+@click.option('--rounds', default=5, show_default=True)
+@with_appcontext
+def bench_format(tiles, rounds):
+    """Cost per show tile of the datetime filter, before and after."""
+    from formatting import format_datetime
+    start = datetime(2030, 1, 1, 20, 0)
+    times = [start + timedelta(hours=3 * i) for i in range(tiles)]
+    with current_app.test_request_context('/'):
+        legacy = microseconds_per_call(
+            lambda t: legacy_format_datetime(t.strftime("%m/%d/%Y, %H:%M"), 'full'),
+            times, rounds)
+        native = microseconds_per_call(lambda t: format_datetime(t, 'full'), times, rounds)
+        strings = [str(t) for t in times]
+        parsed = microseconds_per_call(lambda t: format_datetime(t, 'full'), strings, rounds)
+    click.echo(f'string + parse:   {legacy:8.1f} us/tile')
+    click.echo(f'datetime:         {native:8.1f} us/tile  ({legacy / native:.1f}x)')
+    click.echo(f'string (cached):  {parsed:8.1f} us/tile  ({legacy / parsed:.1f}x)')
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def load_test(base_url, paths, concurrency, duration):
+    # closed loop: each thread requests the paths round-robin until the end
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    lock = threading.Lock()
+
+    def worker(offset):
+        i = offset
+        while time.perf_counter() < deadline:
+            # a path, or (path, form) for a POST
+            path, form = paths[i % len(paths)], None
+            if isinstance(path, tuple):
+                path, form = path
+            data = urllib.parse.urlencode(form).encode() if form is not None else None
+            i += 1
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + path, data, timeout=30) as response:
+                    response.read()
+                ok = True
+            except (urllib.error.URLError, OSError):
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': len(latencies) / duration,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException('server exited during startup')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise click.ClickException(f'server did not listen on port {port}')
+
+
+SERVERS = {
+    'dev server': lambda port: [
+        sys.executable, '-m', 'flask', 'run', '--no-reload', '--port', str(port)],
+    'gunicorn': lambda port: [
+        sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+        '--bind', f'127.0.0.1:{port}', 'app:app'],
+}
+
+
+@contextlib.contextmanager
+def serve(command, env=None):
+    # yields (base url, process) of a server started with `command(port)`
+    port = free_port()
+    process = subprocess.Popen(
+        command(port), cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, 'FLASK_APP': 'app.py', **(env or {})},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, process)
+        yield f'http://127.0.0.1:{port}', process
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run_server(command, paths, concurrency, duration, env=None):
+    with serve(command, env) as (base_url, _):
+        return load_test(base_url, paths, concurrency, duration)
+
+
+@click.command('bench_servers')
+@click.option('--path', 'paths', multiple=True, default=['/', '/venues', '/artists', '/shows'],
+              show_default=True)
+@click.option('--concurrency', default=16, show_default=True)
+@click.option('--duration', default=10, show_default=True, help='Seconds per server.')
+@with_appcontext
+def bench_servers(paths, concurrency, duration):
+    """Load-test the Flask dev server against the gunicorn profile."""
+    # both servers must share this process' key (production requires one)
+    env = {'SECRET_KEY': current_app.secret_key}
+    for name, command in SERVERS.items():
+        result = run_server(command, list(paths), concurrency, duration, env)
+        click.echo(f'{name:<12} {result["rps"]:8.1f} req/s  '
+                   f'p50 {result["p50"]:7.1f} ms  p95 {result["p95"]:7.1f} ms  '
+                   f'p99 {result["p99"]:7.1f} ms  errors {result["errors"]}')
+
+
+# Route benchmarks: every GET route (and the POST searches) through the test
+# client, for latency, SQL statements per request and peak allocations, and
+# optionally through gunicorn for latency under concurrency and worker RSS.
+
+SCALES = {
+    # shows: (venues, artists, shows)
+    '1k': (100, 300, 1000),
+    '100k': (2000, 5000, 100000),
+    '1m': (20000, 50000, 1000000),
+}
+
+SKIP_ENDPOINTS = {'static', 'metrics'}
+
+# terms that match the synthetic rows `--seed` loads (names are only
+# "Venue N"/"Artist N"), one by city and one by genre
+SEARCHES = {
+    'search_venues': {'search_term': CITIES[4][0]},
+    'search_artists': {'search_term': GENRES[10]},
+}
+
+
+def sample_ids(model, count, rng):
+    ids = [row[0] for row in model.query.with_entities(model.id).all()]
+    return rng.sample(ids, min(count, len(ids)))
+
+
+def route_requests(app, samples):
+    # {endpoint: [path or (path, form), ...]}; id arguments cycle through
+    # the sampled ids so detail pages are not all served from one cache entry
+    today = datetime.now().date()
+    availability = {'from': (today + timedelta(days=30)).isoformat(),
+                    'to': (today + timedelta(days=60)).isoformat(),
+                    'weekday': 'fri'}
+    query_args = {'venue_availability': availability, 'artist_availability': availability}
+    routes = {}
+    with app.test_request_context():
+        for rule in app.url_map.iter_rules():
+            if rule.endpoint in SKIP_ENDPOINTS:
+                continue
+            if rule.endpoint in SEARCHES:
+                routes[rule.endpoint] = [(url_for(rule.endpoint), SEARCHES[rule.endpoint])]
+                continue
+            if 'GET' not in rule.methods or not rule.arguments <= set(samples):
+                continue
+            if any(not samples[arg] for arg in rule.arguments):
+                continue
+            count = min(len(samples[arg]) for arg in rule.arguments) if rule.arguments else 1
+            routes[rule.endpoint] = [
+                url_for(rule.endpoint, **{arg: samples[arg][n] for arg in rule.arguments},
+                        **query_args.get(rule.endpoint, {}))
+                for n in range(count)
+            ]
+    return dict(sorted(routes.items()))
+
+
+def send(client, request):
+    from model import db
+    try:
+        if isinstance(request, tuple):
+            path, form = request
+            return client.post(path, data=form)
+        return client.get(request)
+    finally:
+        # the command's app context outlives each request; start every
+        # request with a fresh session as a server would
+        db.session.remove()
+
+
+def measure_client(app, requests, count):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    client = app.test_client()
+    queries = [0]
+
+    def count_query(*args):
+        queries[0] += 1
+
+    for request in requests:
+        send(client, request)  # warm up caches and templates
+    event.listen(Engine, 'after_cursor_execute', count_query)
+    try:
+        latencies = []
+        errors = 0
+        for n in range(count):
+            started = time.perf_counter()
+            response = send(client, requests[n % len(requests)])
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code >= 400
+        statements = queries[0]
+    finally:
+        event.remove(Engine, 'after_cursor_execute', count_query)
+
+    tracemalloc.start()
+    send(client, requests[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'requests': count,
+        'errors': errors,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'queries': statements / count,
+        'peak_kb': peak / 1024,
+    }
+
+
+def process_tree_rss(pid):
+    # resident MB of a process and its children (Linux /proc), None elsewhere
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            children = [int(child) for child in f.read().split()]
+    except (OSError, StopIteration):
+        return None
+    return rss / 1024 + sum(process_tree_rss(child) or 0 for child in children)
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for driver, routes in results['routes'].items():
+        for endpoint, result in routes.items():
+            base = baseline.get('routes', {}).get(driver, {}).get(endpoint)
+            if base is None:
+                continue
+            # ignore sub-millisecond jitter on fast routes
+            if result['p95'] > base['p95'] * (1 + tolerance) and \
+                    result['p95'] - base['p95'] > 1.0:
+                regressions.append(f'{driver} {endpoint}: p95 '
+                                   f'{base["p95"]:.1f} -> {result["p95"]:.1f} ms')
+            if 'queries' in base and result['queries'] > base['queries'] + 0.01:
+                regressions.append(f'{driver} {endpoint}: queries/request '
+                                   f'{base["queries"]:.2f} -> {result["queries"]:.2f}')
+    return regressions
+
+
+def echo_result(endpoint, result):
+    line = (f'  {endpoint:<28} p50 {result["p50"]:7.1f}  p95 {result["p95"]:7.1f}  '
+            f'p99 {result["p99"]:7.1f} ms  errors {result["errors"]}')
+    if 'queries' in result:
+        line += f'  queries {result["queries"]:5.1f}  peak {result["peak_kb"]:8.1f} KB'
+    if result.get('rss_mb') is not None:
+        line += f'  rss {result["rss_mb"]:7.1f} MB'
+    click.echo(line)
+
+
+@click.command('bench_routes')
+@click.option('--scale', type=click.Choice(list(SCALES)), default='1k', show_default=True)
+@click.option('--seed', 'reseed', is_flag=True,
+              help='Replace the database contents with synthetic data of this scale first.')
+@click.option('--yes', is_flag=True, help='Do not ask before reseeding.')
+@click.option('--requests', 'count', default=200, show_default=True,
+              help='Test client requests per route.')
+@click.option('--server/--no-server', default=True, show_default=True,
+              help='Also drive every route through gunicorn.')
+@click.option('--concurrency', default=4, show_default=True)
+@click.option('--duration', default=3, show_default=True, help='Gunicorn seconds per route.')
+@click.option('--sample', default=20, show_default=True, help='Venue/artist ids per route.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write results as JSON.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False),
+              help='Results JSON to compare against; regressions exit non-zero.')
+@click.option('--tolerance', default=0.2, show_default=True,
+              help='Allowed p95 slowdown over the baseline.')
+@click.pass_context
+@with_appcontext
+def bench_routes(ctx, scale, reseed, yes, count, server, concurrency, duration,
+                 sample, output, baseline, tolerance):
+    """Latency, queries and memory of every route, compared to a baseline."""
+    from command import seed
+    from model import Venue, Artist
+
+    venues, artists, shows = SCALES[scale]
+    if reseed:
+        if not yes:
+            click.confirm('This replaces all venues, artists and shows. Continue?', abort=True)
+        ctx.invoke(seed, venue_count=venues, artist_count=artists, show_count=shows)
+
+    app = current_app._get_current_object()
+    rng = random.Random(0)
+    routes = route_requests(app, {
+        'venue_id': sample_ids(Venue, sample, rng),
+        'artist_id': sample_ids(Artist, sample, rng),
+    })
+    results = {'scale': scale, 'created_at': datetime.now().isoformat(),
+               'routes': {'test_client': {}}}
+
+    click.echo(f'Test client, {count} requests per route:')
+    for endpoint, requests in routes.items():
+        result = measure_client(app, requests, count)
+        results['routes']['test_client'][endpoint] = result
+        echo_result(endpoint, result)
+
+    if server:
+        click.echo(f'gunicorn, {concurrency} clients for {duration}s per route:')
+        results['routes']['gunicorn'] = {}
+        env = {'SECRET_KEY': app.secret_key}
+        with serve(SERVERS['gunicorn'], env) as (base_url, process):
+            for endpoint, requests in routes.items():
+                result = load_test(base_url, requests, concurrency, duration)
+                result['rss_mb'] = process_tree_rss(process.pid)
+                results['routes']['gunicorn'][endpoint] = result
+                echo_result(endpoint, result)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline:
+        with open(baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != scale:
+            click.echo(f'warning: baseline was recorded at scale {baseline.get("scale")}')
+        regressions = compare(results, baseline, tolerance)
+        if regressions:
+            raise click.ClickException('regressions against the baseline:\n  ' +
+                                       '\n  '.join(regressions))
+        click.echo('no regressions against the baseline')
@@ -0,0 +1,90 @@
+from datetime import datetime
+
+from dateutil import parser
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from availability import availability_index
+from formatting import timezone
+from model import db, Show, Venue, DEFAULT_SHOW_DURATION
+from stats import record_shows
+
+
+# Show booking. Double bookings are rejected by the exclusion constraints on
+# `shows` (one GiST index probe per row), so a batch is validated and
+# committed in a single transaction: either every show is booked or none is.
+# Start times without an offset are local times at the venue.
+
+EXCLUSION_VIOLATION = '23P01'
+FOREIGN_KEY_VIOLATION = '23503'
+
+
+class BookingError(ValueError):
+    pass
+
+
+class BookingConflict(BookingError):
+    pass
+
+
+def parse_booking(fields):
+    try:
+        start_time = fields['start_time']
+        if isinstance(start_time, str):
+            start_time = parser.parse(start_time)
+        elif not isinstance(start_time, datetime):
+            raise TypeError('start_time must be an ISO 8601 string')
+        duration = fields.get('duration')
+        booking = {
+            'venue_id': int(fields['venue_id']),
+            'artist_id': int(fields['artist_id']),
+            'start_time': start_time,
+            # an empty form field means the default, 0 is rejected below
+            'duration': DEFAULT_SHOW_DURATION if duration in (None, '') else int(duration),
+        }
+    except (KeyError, TypeError, ValueError, OverflowError) as err:
+        raise BookingError(f'invalid show {fields!r}: {err}')
+    if booking['duration'] <= 0:
+        raise BookingError(f'invalid show {fields!r}: duration must be positive')
+    return booking
+
+
+def localize_start_times(bookings):
+    naive = [b for b in bookings if b['start_time'].tzinfo is None]
+    if not naive:
+        return
+    zones = dict(db.session.query(Venue.id, Venue.timezone).filter(
+        Venue.id.in_({b['venue_id'] for b in naive})).all())
+    default = current_app.config['DEFAULT_TIMEZONE']
+    for booking in naive:
+        zone = timezone(zones.get(booking['venue_id'], default))
+        booking['start_time'] = zone.localize(booking['start_time'])
+
+
+def book_shows(bookings):
+    bookings = [parse_booking(fields) for fields in bookings]
+    localize_start_times(bookings)
+    shows = [Show(**booking) for booking in bookings]
+    db.session.add_all(shows)
+    try:
+        db.session.flush()
+        record_shows(shows)
+        # keep the flushed ids and times loaded instead of expiring them on
+        # commit, which would reload every show with its own SELECT
+        for show in shows:
+            db.session.expunge(show)
+        db.session.commit()
+    except IntegrityError as err:
+        db.session.rollback()
+        code = getattr(err.orig, 'pgcode', None)
+        if code == EXCLUSION_VIOLATION:
+            raise BookingConflict(err.orig.diag.message_detail or 'show overlaps a booking')
+        if code == FOREIGN_KEY_VIOLATION:
+            raise BookingError('unknown venue or artist')
+        raise
+    availability_index.booked(shows)
+    return shows
+
+
+def book_show(fields):
+    return book_shows([fields])[0]
@@ -0,0 +1,241 @@
+import fcntl
+import hashlib
+import itertools
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+# Render cache for venue/artist detail pages and their `data` dicts.
+# Two interchangeable backends: an in-process LRU with per-entry TTL, and a
+# filesystem store shared by every worker on the host. Entries are keyed per
+# entity ("venue:1:data", "venue:1:page") so writes can drop exactly the
+# entities they touch. lock_key(key) serializes read-modify-write updates of one
+# key among everyone sharing the backend. The filesystem store has no
+# eviction of its own, so every SWEEP_EVERY writes a process sweeps it: expired
+# entries go, then the oldest (by mtime) beyond max_entries.
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.update_lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.time() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    @contextmanager
+    def lock_key(self, key):
+        # the entries are private to this process, so a thread lock will do
+        with self.update_lock:
+            yield
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class FileSystemBackend:
+    SWEEP_EVERY = 256
+
+    def __init__(self, directory, max_entries=None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.writes = itertools.count(1)
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires <= time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl):
+        # write to a temp file and rename so readers never see half an entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((time.time() + ttl, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path(key))
+        if next(self.writes) % self.SWEEP_EVERY == 0:
+            self.sweep()
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        # lock files stay, someone may be holding one
+        for name in self.entry_names():
+            os.remove(os.path.join(self.directory, name))
+
+    def purge(self):
+        # expired entries are otherwise only removed when they are read
+        # again; returns the number removed
+        removed = 0
+        for name in self.entry_names():
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'rb') as f:
+                    expires, _ = pickle.load(f)
+                if expires <= time.time():
+                    os.remove(path)
+                    removed += 1
+            except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+                # gone already, or a temp file still being written
+                continue
+        return removed
+
+    def sweep(self):
+        removed = self.purge()
+        if self.max_entries is None:
+            return removed
+        entries = []
+        for name in self.entry_names():
+            if name.startswith('tmp'):
+                # mkstemp's, still being written
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        for _, path in entries[:max(len(entries) - self.max_entries, 0)]:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    @contextmanager
+    def lock_key(self, key):
+        # flock is held per open file, so this excludes other threads as
+        # well as other processes on the host
+        with open(self.path(key) + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def entry_names(self):
+        return [name for name in os.listdir(self.directory) if not name.endswith('.lock')]
+
+    def __len__(self):
+        return len(self.entry_names())
+
+
+class RenderCache:
+    PARTS = ('data', 'page')
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.default_ttl = 300
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.invalidations = 0
+        # the counters are bumped from every request thread
+        self.stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', 300)
+        backend = app.config.get('CACHE_BACKEND', 'memory')
+        if backend == 'filesystem':
+            self.backend = FileSystemBackend(app.config['CACHE_DIR'],
+                                             app.config.get('CACHE_MAX_ENTRIES', 1024))
+        else:
+            if app.config.get('PRODUCTION'):
+                # other workers would keep serving pages this one invalidated
+                app.logger.warning('CACHE_BACKEND=memory is per process; writes only '
+                                   'invalidate the worker that handled them')
+            self.backend = MemoryBackend(app.config.get('CACHE_MAX_ENTRIES', 1024))
+
+    @staticmethod
+    def key(kind, entity_id, part):
+        return f'{kind}:{entity_id}:{part}'
+
+    def get(self, kind, entity_id, part):
+        value = self.backend.get(self.key(kind, entity_id, part))
+        with self.stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, kind, entity_id, part, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else min(ttl, self.default_ttl)
+        if ttl <= 0:
+            return
+        with self.stats_lock:
+            self.sets += 1
+        self.backend.set(self.key(kind, entity_id, part), value, ttl)
+
+    def invalidate(self, kind, *entity_ids):
+        with self.stats_lock:
+            self.invalidations += len(entity_ids)
+        for entity_id in entity_ids:
+            for part in self.PARTS:
+                self.backend.delete(self.key(kind, entity_id, part))
+
+    def stats(self):
+        with self.stats_lock:
+            hits, misses = self.hits, self.misses
+            sets, invalidations = self.sets, self.invalidations
+        lookups = hits + misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+            'sets': sets,
+            'invalidations': invalidations,
+        }
+
+
+render_cache = RenderCache()
@@ -1,3 +1,9 @@
+import csv
+import io
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
 import click
 from flask.cli import with_appcontext
 from raw_data import venues, artists, shows
@@ -60,15 +66,27 @@ def make_venue_or_artist(type):
 
 
 def clear_db(db):
-    db.session.execute('''TRUNCATE TABLE shows, venues, artists''')
+    # the rollups reference venues and artists, so they go in the same statement
+    db.session.execute('''TRUNCATE TABLE shows, venues, artists, venue_stats, artist_stats,
+                          facet_counts RESTART IDENTITY''')
+    db.session.commit()
+
+
+def reset_sequences(db):
+    # rows are loaded with explicit ids, move the id sequences past them
+    for table in ('venues', 'artists', 'shows'):
+        db.session.execute(f'''
+            SELECT setval(pg_get_serial_sequence('{table}', 'id'),
+                          coalesce(max(id), 1), max(id) IS NOT NULL)
+            FROM {table}''')
     db.session.commit()
 
 
 def seed_venues_and_artist(model_types, db):
     for model_type in model_types:
-        for venue in make_venue_or_artist(model_type[0]):
-            db.session.add(model_type[1](**venue))
-            db.session.commit()
+        db.session.bulk_insert_mappings(
+            model_type[1], make_venue_or_artist(model_type[0]))
+    db.session.commit()
 
 
 def make_venue_or_artist_from_raw(type):
@@ -77,22 +95,313 @@ def make_venue_or_artist_from_raw(type):
 
 
 def seed_venues_and_artist_from_raw(model_types, db):
+    # one transaction, one multi-row insert per table
     for model_type in model_types:
-        for venue in make_venue_or_artist_from_raw(model_type[0]):
-            db.session.add(model_type[1](**venue))
-            db.session.commit()
+        db.session.bulk_insert_mappings(
+            model_type[1], make_venue_or_artist_from_raw(model_type[0]))
+    db.session.commit()
+    reset_sequences(db)
+
+
+#  Synthetic data
+#  ----------------------------------------------------------------
+
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+          'Funk', 'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz',
+          'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll',
+          'Soul', 'Other']
+CITIES = [('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('New York', 'NY'),
+          ('Chicago', 'IL'), ('Austin', 'TX'), ('Seattle', 'WA'),
+          ('Nashville', 'TN'), ('Denver', 'CO'), ('Boston', 'MA'),
+          ('Atlanta', 'GA'), ('Miami', 'FL'), ('Portland', 'OR')]
+STATE_TIMEZONES = {'CA': 'America/Los_Angeles', 'WA': 'America/Los_Angeles',
+                   'OR': 'America/Los_Angeles', 'CO': 'America/Denver',
+                   'IL': 'America/Chicago', 'TX': 'America/Chicago',
+                   'TN': 'America/Chicago', 'NY': 'America/New_York',
+                   'MA': 'America/New_York', 'GA': 'America/New_York',
+                   'FL': 'America/New_York'}
+IMAGE_LINK = 'https://via.placeholder.com/350x150'
+
+VENUE_COLUMNS = ['id', 'name', 'city', 'state', 'address', 'phone', 'genres',
+                 'image_link', 'website', 'facebook_link', 'timezone',
+                 'seeking_talent', 'seeking_description']
+ARTIST_COLUMNS = ['id', 'name', 'city', 'state', 'phone', 'genres',
+                  'image_link', 'website', 'facebook_link', 'seeking_venue',
+                  'seeking_description']
+SHOW_COLUMNS = ['id', 'venue_id', 'artist_id', 'start_time']
+
+
+def synthetic_venues(count, rng):
+    for i in range(1, count + 1):
+        city, state = rng.choice(CITIES)
+        yield {
+            'id': i,
+            'name': f'Venue {i}',
+            'city': city,
+            'state': state,
+            'address': f'{rng.randint(1, 9999)} Main Street',
+            'phone': f'555-{rng.randint(0, 9999):04d}',
+            'genres': rng.sample(GENRES, rng.randint(1, 4)),
+            'image_link': IMAGE_LINK,
+            'website': f'https://venue{i}.example.com',
+            'facebook_link': f'https://www.facebook.com/venue{i}',
+            'timezone': STATE_TIMEZONES[state],
+            'seeking_talent': rng.random() < 0.5,
+            'seeking_description': 'We are looking for an exciting artist to perform here!'
+        }
+
+
+def synthetic_artists(count, rng):
+    for i in range(1, count + 1):
+        city, state = rng.choice(CITIES)
+        yield {
+            'id': i,
+            'name': f'Artist {i}',
+            'city': city,
+            'state': state,
+            'phone': f'555-{rng.randint(0, 9999):04d}',
+            'genres': rng.sample(GENRES, rng.randint(1, 3)),
+            'image_link': IMAGE_LINK,
+            'website': f'https://artist{i}.example.com',
+            'facebook_link': f'https://www.facebook.com/artist{i}',
+            'seeking_venue': rng.random() < 0.5,
+            'seeking_description': 'We are looking to perform at an exciting venue!'
+        }
+
+
+SLOT_HOURS = 3
+
+
+def show_slots(years):
+    return 2 * years * 365 * 24 // SLOT_HOURS
+
+
+def synthetic_shows(count, venue_count, artist_count, rng, years=5):
+    # Shows go into 3-hour slots spread over `years` back and `years` forward
+    # from today. Within a slot every show gets a different venue and artist,
+    # so the seeded data never trips the double-booking constraints.
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    slots = show_slots(years)
+    first = now - timedelta(hours=slots // 2 * SLOT_HOURS)
+    offsets = [(rng.randrange(venue_count), rng.randrange(artist_count))
+               for _ in range(min(count, slots))]
+    for i in range(count):
+        slot, j = i % slots, i // slots
+        venue_offset, artist_offset = offsets[slot]
+        yield {
+            'id': i + 1,
+            'venue_id': 1 + (venue_offset + j) % venue_count,
+            'artist_id': 1 + (artist_offset + j) % artist_count,
+            'start_time': first + timedelta(hours=slot * SLOT_HOURS)
+        }
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def pg_array(values):
+    return '{' + ','.join(
+        '"' + v.replace('\\', '\\\\').replace('"', '\\"') + '"' for v in values
+    ) + '}'
+
+
+def copy_rows(db, table, columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            pg_array(value) if isinstance(value, list) else
+            '' if value is None else value
+            for value in (row[c] for c in columns)
+        ])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(
+        f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def insert_rows(db, table, columns, rows):
+    db.session.execute(db.Model.metadata.tables[table].insert(), rows)
+
+
+def load_rows(db, table, columns, rows, batch_size, method):
+    # one transaction per batch; COPY for speed, executemany as fallback
+    load = copy_rows if method == 'copy' else insert_rows
+    total = 0
+    started = time.perf_counter()
+    for batch in batches(rows, batch_size):
+        load(db, table, columns, batch)
+        db.session.commit()
+        total += len(batch)
+    elapsed = time.perf_counter() - started
+    click.echo(f'{table}: {total} rows in {elapsed:.1f}s '
+               f'({total / elapsed if elapsed else 0:,.0f} rows/s)')
+
+
+def seed_synthetic(db, venue_count, artist_count, show_count,
+                   batch_size=10000, method='copy', seed_value=0):
+    if venue_count and artist_count and \
+            show_count > show_slots(5) * min(venue_count, artist_count):
+        raise click.UsageError(
+            'too many shows to book without overlaps; add venues or artists')
+    rng = random.Random(seed_value)
+    load_rows(db, 'venues', VENUE_COLUMNS,
+              synthetic_venues(venue_count, rng), batch_size, method)
+    load_rows(db, 'artists', ARTIST_COLUMNS,
+              synthetic_artists(artist_count, rng), batch_size, method)
+    if venue_count and artist_count:
+        load_rows(db, 'shows', SHOW_COLUMNS,
+                  synthetic_shows(show_count, venue_count, artist_count, rng),
+                  batch_size, method)
+    reset_sequences(db)
 
 
 @click.command("seed_db")
+@click.option('--venues', 'venue_count', default=0,
+              help='Generate this many synthetic venues instead of raw_data.')
+@click.option('--artists', 'artist_count', default=0,
+              help='Generate this many synthetic artists.')
+@click.option('--shows', 'show_count', default=0,
+              help='Generate this many synthetic shows.')
+@click.option('--batch-size', default=10000, show_default=True,
+              help='Rows per transaction.')
+@click.option('--method', type=click.Choice(['copy', 'insert']), default='copy',
+              show_default=True, help='COPY FROM STDIN or executemany inserts.')
+@click.option('--seed', 'seed_value', default=0, show_default=True,
+              help='Random seed for the synthetic generator.')
 @with_appcontext
-def seed():
-    from model import Venue, Artist, Show, db
-    # db.init_app(app)
+def seed(venue_count, artist_count, show_count, batch_size, method, seed_value):
     """Seed the database."""
+    from model import Venue, Artist, Show, db
+    from facets import refresh_facet_counts
+    from stats import refresh_show_stats
     clear_db(db)
-    seed_venues_and_artist_from_raw(
-        [['venue', Venue], ['artist', Artist], ['show', Show]], db
-    )
-    # seed_venues_and_artist(
-    #     [['venue', Venue], ['artist', Artist]], db
-    # )
+    if venue_count or artist_count or show_count:
+        seed_synthetic(db, venue_count, artist_count, show_count,
+                       batch_size, method, seed_value)
+    else:
+        seed_venues_and_artist_from_raw(
+            [['venue', Venue], ['artist', Artist], ['show', Show]], db
+        )
+    # bulk loads bypass the write paths that keep facet counts and show
+    # stats current
+    refresh_facet_counts()
+    refresh_show_stats()
+    db.session.commit()
+
+
+@click.command("refresh_facets")
+@with_appcontext
+def refresh_facets():
+    """Recount the browse facets from the venues and artists tables."""
+    from model import db
+    from facets import refresh_facet_counts
+    refresh_facet_counts()
+    db.session.commit()
+
+
+@click.command("purge_sessions")
+@with_appcontext
+def purge_sessions():
+    """Delete expired server-side sessions."""
+    from flask import current_app
+    from cache import FileSystemBackend
+    if current_app.config.get('SESSION_BACKEND') != 'filesystem':
+        click.echo('SESSION_BACKEND is not filesystem, nothing to purge')
+        return
+    removed = FileSystemBackend(current_app.config['SESSION_DIR']).purge()
+    click.echo(f'removed {removed} expired sessions')
+
+
+@click.command("roll_show_stats")
+@click.option('--interval', default=0, show_default=True,
+              help='Keep running, rolling every this many seconds.')
+@with_appcontext
+def roll_show_stats(interval):
+    """Move shows that have started from upcoming to past in the show stats."""
+    from model import db
+    from stats import roll_stats
+    while True:
+        rolled = roll_stats()
+        db.session.commit()
+        click.echo(f'rolled {rolled["venues"]} venues, {rolled["artists"]} artists')
+        if not interval:
+            break
+        time.sleep(interval)
+
+
+@click.command("process_images")
+@click.option('--batch-size', default=10, show_default=True)
+@click.option('--poll', default=5.0, show_default=True,
+              help='Seconds to wait when the queue is empty.')
+@click.option('--once', is_flag=True, help='Exit once the queue is empty.')
+@with_appcontext
+def process_images(batch_size, poll, once):
+    """Make thumbnails for queued image links and uploads."""
+    from images import process_images as process_batch
+    while True:
+        processed, failed = process_batch(batch_size)
+        if processed or failed:
+            click.echo(f'{processed} images done, {failed} failed')
+        elif once:
+            break
+        else:
+            time.sleep(poll)
+
+
+@click.command("queue_images")
+@click.option('--retry-failed', is_flag=True, help='Queue failed images again.')
+@with_appcontext
+def queue_images(retry_failed):
+    """Queue the image links of every venue and artist for thumbnails."""
+    from model import db, Venue, Artist, Image
+    from images import enqueue_images
+    enqueue_images(*[row[0] for row in db.session.query(Venue.image_link).union(
+        db.session.query(Artist.image_link)).all()])
+    if retry_failed:
+        db.session.query(Image).filter_by(status='failed').update(
+            {'status': 'pending', 'attempts': 0, 'available_at': db.func.now()},
+            synchronize_session=False)
+    db.session.commit()
+
+
+@click.command("build_assets")
+@with_appcontext
+def build_assets():
+    """Bundle, minify and fingerprint static files into static/dist."""
+    from flask import current_app
+    from assets import build
+    manifest = build(current_app.static_folder)
+    click.echo(f'{len(manifest["files"])} files, '
+               f'{sum(map(len, manifest["encodings"].values()))} compressed variants')
+
+
+@click.command("export")
+@click.argument('kind', type=click.Choice(['shows', 'venues', 'artists']))
+@click.option('--format', 'format', type=click.Choice(['csv', 'ndjson']),
+              default='csv', show_default=True)
+@click.option('--output', '-o', type=click.File('wb'), default='-',
+              help='File to write (default: stdout).')
+@click.option('--since', help='Shows starting at or after this date/time.')
+@click.option('--until', help='Shows starting before this date/time.')
+@click.option('--updated-since', help='Rows changed at or after this date/time.')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Rows fetched per round trip.')
+@with_appcontext
+def export(kind, format, output, since, until, updated_since, batch_size):
+    """Stream shows, venues or artists as CSV or NDJSON."""
+    from export import export_chunks, export_query
+    try:
+        query = export_query(kind, since, until, updated_since)
+    except ValueError as err:
+        raise click.UsageError(str(err))
+    for chunk in export_chunks(query, format, batch_size):
+        output.write(chunk)
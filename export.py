@@ -0,0 +1,143 @@
+import csv
+import hmac
+import io
+import json
+from datetime import date, datetime, timezone
+
+import dateutil.parser
+from flask import Blueprint, Response, abort, current_app, request, stream_with_context
+
+from formatting import timezone as get_timezone
+from model import db, Show, Venue, Artist
+
+
+# Bulk export of shows (with venue and artist names), venues and artists as
+# CSV or NDJSON, for `flask export` and GET /export/<kind>.<format>. Rows
+# are read as plain tuples through a server-side cursor (Query.yield_per)
+# and written out in chunks by a generator, so memory stays flat however
+# large the tables are. Rows come in id order.
+
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+CHUNK_ROWS = 500
+
+export = Blueprint('export', __name__, url_prefix='/export')
+
+
+def show_columns():
+    return [Show.id, Show.start_time, Show.duration, Show.venue_id,
+            Venue.name.label('venue_name'), Venue.timezone.label('venue_timezone'),
+            Show.artist_id, Artist.name.label('artist_name'), Show.updated_at]
+
+
+def entity_columns(model):
+    return [column for column in model.__table__.columns]
+
+
+def parse_time(value, name):
+    # naive values are in DEFAULT_TIMEZONE
+    if value is None or value == '':
+        return None
+    try:
+        parsed = dateutil.parser.isoparse(value) if isinstance(value, str) else value
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO 8601 date or time, got {value!r}')
+    if not isinstance(parsed, datetime):
+        parsed = datetime.combine(parsed, datetime.min.time())
+    if parsed.tzinfo is None:
+        parsed = get_timezone(current_app.config['DEFAULT_TIMEZONE']).localize(parsed)
+    return parsed
+
+
+def export_query(kind, since=None, until=None, updated_since=None):
+    # since/until bound the show start time; updated_since the row version
+    since, until = parse_time(since, 'since'), parse_time(until, 'until')
+    updated_since = parse_time(updated_since, 'updated_since')
+    if kind == 'shows':
+        model = Show
+        query = db.session.query(*show_columns()).join(
+            Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+        if since:
+            query = query.filter(Show.start_time >= since)
+        if until:
+            query = query.filter(Show.start_time < until)
+    elif kind in ('venues', 'artists'):
+        if since or until:
+            raise ValueError('since/until only apply to shows')
+        model = Venue if kind == 'venues' else Artist
+        query = db.session.query(*entity_columns(model))
+    else:
+        raise ValueError(f'unknown export {kind!r}')
+    if updated_since:
+        # row versions are naive UTC
+        query = query.filter(model.updated_at >= updated_since.astimezone(
+            timezone.utc).replace(tzinfo=None))
+    return query.order_by(model.id)
+
+
+def plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def csv_value(value):
+    if isinstance(value, list):
+        return ';'.join(value)
+    return plain(value)
+
+
+def export_chunks(query, format, batch_size=1000):
+    # encoded chunks of about CHUNK_ROWS rows, starting with the CSV header
+    names = [column['name'] for column in query.column_descriptions]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if format == 'csv':
+        writer.writerow(names)
+    count = 0
+    for row in query.yield_per(batch_size):
+        if format == 'csv':
+            writer.writerow([csv_value(value) for value in row])
+        else:
+            buffer.write(json.dumps(dict(zip(names, map(plain, row))),
+                                    separators=(',', ':')))
+            buffer.write('\n')
+        count += 1
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def authorized():
+    token = current_app.config.get('EXPORT_TOKEN')
+    if not token:
+        return False
+    scheme, _, given = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(given.encode(), token.encode())
+
+
+@export.route('/<kind>.<format>')
+def export_view(kind, format):
+    # e.g. /export/shows.csv?since=2026-01-01&until=2027-01-01&updated_since=...
+    # with `Authorization: Bearer $EXPORT_TOKEN`; disabled when it is unset
+    if not current_app.config.get('EXPORT_TOKEN'):
+        abort(404)
+    if not authorized():
+        return Response('export token required\n', 401,
+                        {'WWW-Authenticate': 'Bearer realm="export"'})
+    if format not in FORMATS:
+        abort(404)
+    try:
+        query = export_query(kind, request.args.get('since'), request.args.get('until'),
+                             request.args.get('updated_since'))
+    except ValueError as err:
+        return Response(f'{err}\n', 400, mimetype='text/plain')
+    response = Response(stream_with_context(
+        export_chunks(query, format, current_app.config['EXPORT_BATCH_SIZE'])),
+        mimetype=FORMATS[format])
+    response.headers['Content-Disposition'] = f'attachment; filename={kind}.{format}'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
@@ -0,0 +1,127 @@
+from sqlalchemy.dialects import postgresql
+
+from model import db, FacetCount, Venue, Artist
+
+
+# Faceted browsing. Each venue/artist contributes one count to every facet
+# value it has (each genre, its city, its state, seeking yes/no). The counts
+# live in `facet_counts` and the write paths apply +1/-1 deltas in their own
+# transaction, so the browse pages read a few rows instead of counting the
+# tables. Result lists are filtered with the GIN-indexed `genres @>`.
+
+KINDS = {
+    'venues': (Venue, 'seeking_talent'),
+    'artists': (Artist, 'seeking_venue'),
+}
+
+FACETS = ('genre', 'state', 'city', 'seeking')
+
+
+def facet_values(kind, entity):
+    if entity is None:
+        return set()
+    _, seeking = KINDS[kind]
+    values = {('genre', genre) for genre in entity.genres or ()}
+    values.add(('city', entity.city))
+    values.add(('state', entity.state))
+    values.add(('seeking', 'yes' if getattr(entity, seeking) else 'no'))
+    return values
+
+
+def update_facet_counts(kind, before=frozenset(), after=frozenset()):
+    # call before the commit with the facet_values() of the entity as it was
+    # and as it is now; rows are upserted in key order to avoid deadlocks
+    deltas = {value: 1 for value in after - before}
+    deltas.update({value: -1 for value in before - after})
+    if not deltas:
+        return
+    insert = postgresql.insert(FacetCount).values([
+        {'kind': kind, 'facet': facet, 'value': value, 'count': delta}
+        for (facet, value), delta in sorted(deltas.items())
+    ])
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['kind', 'facet', 'value'],
+        set_={'count': FacetCount.count + insert.excluded.count}
+    ))
+
+
+def refresh_facet_counts():
+    # full recount, for bulk loads that bypass the write paths
+    db.session.query(FacetCount).delete()
+    for kind, (model, seeking) in KINDS.items():
+        genre = db.func.unnest(model.genres).label('value')
+        genres = db.session.query(genre, model.id).subquery()
+        kind_value = db.literal(kind)
+        counts = [
+            db.select(kind_value, db.literal('genre'), genres.c.value,
+                      db.func.count(db.distinct(genres.c.id))).group_by(genres.c.value),
+            db.select(kind_value, db.literal('city'), model.city,
+                      db.func.count()).group_by(model.city),
+            db.select(kind_value, db.literal('state'), model.state,
+                      db.func.count()).group_by(model.state),
+            db.select(kind_value, db.literal('seeking'),
+                      db.case((getattr(model, seeking), 'yes'), else_='no'),
+                      db.func.count()).group_by(getattr(model, seeking)),
+        ]
+        for select in counts:
+            db.session.execute(db.insert(FacetCount).from_select(
+                ['kind', 'facet', 'value', 'count'], select))
+
+
+def parse_filters(args):
+    seeking = args.get('seeking')
+    return {
+        'genre': sorted(set(args.getlist('genre'))),
+        'city': args.get('city') or None,
+        'state': args.get('state') or None,
+        'seeking': seeking if seeking in ('yes', 'no') else None,
+    }
+
+
+def filtered_query(kind, filters):
+    model, seeking = KINDS[kind]
+    query = db.session.query(model.id, model.name, model.city, model.state)
+    if filters['genre']:
+        query = query.filter(model.genres.op('@>')(
+            db.cast(postgresql.array(filters['genre']), postgresql.ARRAY(db.String))))
+    if filters['city']:
+        query = query.filter(model.city == filters['city'])
+    if filters['state']:
+        query = query.filter(model.state == filters['state'])
+    if filters['seeking']:
+        query = query.filter(getattr(model, seeking) == (filters['seeking'] == 'yes'))
+    return query
+
+
+def facet_summary(kind, limit=30):
+    # {facet: [(value, count), ...]} with the `limit` most common values each
+    rank = db.func.row_number().over(
+        partition_by=FacetCount.facet,
+        order_by=(FacetCount.count.desc(), FacetCount.value)
+    ).label('rank')
+    ranked = db.session.query(
+        FacetCount.facet, FacetCount.value, FacetCount.count, rank
+    ).filter(FacetCount.kind == kind, FacetCount.count > 0).subquery()
+    rows = db.session.query(ranked.c.facet, ranked.c.value, ranked.c.count).filter(
+        ranked.c.rank <= limit).order_by(ranked.c.facet, ranked.c.rank).all()
+    summary = {facet: [] for facet in FACETS}
+    for facet, value, count in rows:
+        summary[facet].append((value, count))
+    return summary
+
+
+def matching_total(kind, summary, filters):
+    # known without counting when at most one facet value is selected
+    selected = [(facet, value) for facet in FACETS
+                for value in (filters[facet] if facet == 'genre' else [filters[facet]])
+                if value]
+    if not selected:
+        return sum(count for _, count in summary['seeking'])
+    if len(selected) == 1:
+        facet, value = selected[0]
+        counts = dict(summary[facet])
+        if value in counts:
+            return counts[value]
+        return db.session.query(FacetCount.count).filter_by(
+            kind=kind, facet=facet, value=value).scalar() or 0
+    return None
@@ -0,0 +1,96 @@
+from datetime import date, datetime
+from functools import lru_cache
+
+import babel.dates
+import dateutil.parser
+from babel import Locale, UnknownLocaleError
+from flask import current_app, g, has_request_context, request, session
+
+
+# Date formatting for templates. Views hand over datetimes as they come from
+# the database; strings are still accepted (and parsed once per distinct
+# value) for data cached before that. Babel locales and parsed patterns are
+# cached per (format, locale), so a tile costs one pattern.apply().
+# Show times are shown in the venue's timezone unless the user saved one of
+# their own; naive datetimes are taken to be in DEFAULT_TIMEZONE.
+
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=256)
+def compiled_format(format, locale):
+    return babel.dates.parse_pattern(FORMATS.get(format, format)), Locale.parse(locale)
+
+
+@lru_cache(maxsize=64)
+def timezone(name):
+    return babel.dates.get_timezone(name)
+
+
+@lru_cache(maxsize=4096)
+def parse_datetime(value):
+    return dateutil.parser.parse(value)
+
+
+def to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return parse_datetime(value)
+
+
+def valid_locale(name):
+    try:
+        Locale.parse(name)
+    except (ValueError, UnknownLocaleError):
+        return False
+    return True
+
+
+def valid_timezone(name):
+    try:
+        timezone(name)
+    except LookupError:
+        return False
+    return True
+
+
+def user_preferences():
+    # (locale, timezone or None) of the current user, resolved once per
+    # request: saved preferences first, then the Accept-Language header
+    config = current_app.config
+    if not has_request_context():
+        return config['DEFAULT_LOCALE'], None
+    if 'datetime_preferences' not in g:
+        locale = session.get('locale') or request.accept_languages.best_match(
+            config['SUPPORTED_LOCALES']) or config['DEFAULT_LOCALE']
+        g.datetime_preferences = (locale, session.get('timezone'))
+    return g.datetime_preferences
+
+
+def default_preferences():
+    # cached pages are rendered with the defaults
+    return user_preferences() == (current_app.config['DEFAULT_LOCALE'], None)
+
+
+def localize(value, tz_name):
+    default_tz = current_app.config['DEFAULT_TIMEZONE']
+    if value.tzinfo is None:
+        if tz_name == default_tz:
+            return value
+        value = timezone(default_tz).localize(value)
+    return value.astimezone(timezone(tz_name))
+
+
+def format_datetime(value, format='medium', locale=None, tz=None):
+    # tz: the zone of the place, e.g. the venue of a show
+    if value is None or value == '':
+        return ''
+    user_locale, user_tz = user_preferences()
+    pattern, locale = compiled_format(format, locale or user_locale)
+    tz = user_tz or tz or current_app.config['DEFAULT_TIMEZONE']
+    return pattern.apply(localize(to_datetime(value), tz), locale)
@@ -1,7 +1,8 @@
 from datetime import datetime
+import pytz
 from wsgiref.validate import validator
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField
 from wtforms.validators import DataRequired, AnyOf, URL, Regexp
 
 
@@ -17,6 +18,9 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default=datetime.today()
     )
+    duration = IntegerField(
+        'duration', default=120
+    )
 
 
 class VenueForm(Form):
@@ -122,6 +126,12 @@ class VenueForm(Form):
     website_link = StringField(
         'website_link'
     )
+    # show times at the venue are entered and shown in its timezone
+    timezone = SelectField(
+        'timezone', validators=[DataRequired()],
+        choices=[(tz, tz) for tz in pytz.common_timezones],
+        default='UTC'
+    )
 
     seeking_talent = BooleanField('seeking_talent')
 
@@ -0,0 +1,50 @@
+import multiprocessing
+import os
+
+# gunicorn -c gunicorn.conf.py app:app
+#
+# Every worker process opens its own SQLAlchemy pool, so the pool size is
+# derived from the concurrency of one worker and capped so that
+# workers * (pool + overflow) stays below DB_MAX_CONNECTIONS.
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+# 'gthread' (default) or 'gevent' (needs the gevent and psycogreen packages)
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+# recycle workers now and then to bound memory growth
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+
+max_connections = int(os.getenv('DB_MAX_CONNECTIONS', 100))
+concurrency = threads if worker_class == 'gthread' else worker_connections
+per_worker = max(max_connections // workers, 1)
+pool_size = min(concurrency, per_worker)
+
+os.environ.setdefault('APP_ENV', 'production')
+# the render cache and home snapshot must be shared by the workers, or
+# writes only reach the one that handled them
+os.environ.setdefault('CACHE_BACKEND', 'filesystem')
+os.environ.setdefault('DB_POOL_SIZE', str(pool_size))
+os.environ.setdefault('DB_MAX_OVERFLOW', str(max(min(per_worker - pool_size, 2), 0)))
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # psycopg2 blocks the whole process unless it cooperates with gevent
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            server.log.warning('psycogreen is not installed, '
+                               'database calls will block the gevent loop')
+        else:
+            patch_psycopg()
@@ -0,0 +1,297 @@
+import hashlib
+import io
+import ipaddress
+import os
+import socket
+import tempfile
+import threading
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+from flask import current_app, send_from_directory, url_for
+from markupsafe import Markup
+from PIL import Image as PILImage, ImageOps
+from sqlalchemy.dialects import postgresql
+
+from model import db, Image, request_now
+
+
+# Thumbnails for the image_link of venues and artists. Write paths queue
+# each new link as an `images` row; `flask process_images` claims pending
+# rows with FOR UPDATE SKIP LOCKED (any number of workers), downloads the
+# original once and writes JPEG and WebP thumbnails at THUMBNAIL_WIDTHS.
+# Files are named after the sha256 of the original, so a URL never changes
+# content and is served with a one-year immutable Cache-Control. Templates
+# call responsive_image(), which falls back to the original link until the
+# thumbnails exist. Uploaded originals go through the same queue.
+
+FORMATS = {'webp': ('WEBP', {'quality': 75, 'method': 4}),
+           'jpg': ('JPEG', {'quality': 80, 'optimize': True, 'progressive': True})}
+
+UPLOAD_TYPES = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+THUMBNAIL_PATH = '/media/thumbs/'
+UPLOAD_PATH = '/media/uploads/'
+
+# content-addressed files never change
+IMMUTABLE = 365 * 24 * 3600
+
+
+class ImageError(Exception):
+    pass
+
+
+# Queue
+
+def enqueue_images(*urls):
+    # call before the commit that stores the links; known links are skipped
+    urls = sorted({url for url in urls if url})
+    if not urls:
+        return
+    insert = postgresql.insert(Image).values([{'source_url': url} for url in urls])
+    db.session.execute(insert.on_conflict_do_nothing(index_elements=['source_url']))
+
+
+def claim_jobs(limit, lease):
+    # pending rows, plus processing rows whose worker let the lease run out
+    now = request_now()
+    claimable = db.session.query(Image.id).filter(
+        Image.status.in_(('pending', 'processing')), Image.available_at <= now
+    ).order_by(Image.available_at, Image.id).limit(limit).with_for_update(
+        skip_locked=True).subquery()
+    claimed = db.session.execute(
+        db.update(Image).where(Image.id.in_(db.select(claimable.c.id))).values(
+            status='processing', available_at=now + lease,
+            attempts=Image.attempts + 1
+        ).returning(Image.id, Image.source_url, Image.attempts)
+    ).fetchall()
+    db.session.commit()
+    return claimed
+
+
+def finish_job(image_id, **values):
+    db.session.execute(db.update(Image).where(Image.id == image_id).values(**values))
+    db.session.commit()
+
+
+# Fetching
+
+def check_public_host(url):
+    # only http(s) to public addresses: links are user input
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ImageError(f'unsupported image URL {url!r}')
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or 443)
+    except socket.gaierror as err:
+        raise ImageError(f'cannot resolve {parts.hostname}: {err}')
+    for address in addresses:
+        if not ipaddress.ip_address(address[4][0]).is_global:
+            raise ImageError(f'{parts.hostname} is not a public host')
+
+
+def read_limited(stream, max_bytes):
+    data = stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ImageError(f'image larger than {max_bytes} bytes')
+    return data
+
+
+class PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_public_host(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+opener = urllib.request.build_opener(PublicRedirectHandler)
+
+
+def fetch_original(source_url):
+    config = current_app.config
+    if source_url.startswith(UPLOAD_PATH):
+        name = os.path.basename(source_url[len(UPLOAD_PATH):])
+        try:
+            with open(os.path.join(config['UPLOAD_DIR'], name), 'rb') as f:
+                return read_limited(f, config['IMAGE_MAX_BYTES'])
+        except FileNotFoundError:
+            raise ImageError(f'uploaded image {name} is missing')
+    check_public_host(source_url)
+    request = urllib.request.Request(
+        source_url, headers={'User-Agent': 'EmpireBooking-thumbnailer'})
+    try:
+        with opener.open(request, timeout=config['IMAGE_FETCH_TIMEOUT']) as response:
+            return read_limited(response, config['IMAGE_MAX_BYTES'])
+    except (OSError, ValueError) as err:
+        raise ImageError(f'cannot fetch {source_url}: {err}')
+
+
+# Thumbnails
+
+def thumbnail_widths(original_width, widths):
+    # never upscale: narrow originals get a single thumbnail at their width
+    return sorted({min(width, original_width) for width in widths})
+
+
+def thumbnail_name(digest, width, extension):
+    return f'{digest[:2]}/{digest[:24]}-{width}.{extension}'
+
+
+def write_atomically(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def make_thumbnails(data, directory, widths):
+    # (digest, width, height) of the decoded image; files that exist are kept
+    digest = hashlib.sha256(data).hexdigest()
+    try:
+        with PILImage.open(io.BytesIO(data)) as original:
+            # JPEGs decode at a reduced scale that still covers the widest
+            # thumbnail, which is much faster for large photos
+            original.draft('RGB', (max(widths), max(widths)))
+            original.load()
+            image = ImageOps.exif_transpose(original).convert('RGB')
+    except (OSError, ValueError, PILImage.DecompressionBombError) as err:
+        raise ImageError(f'not a usable image: {err}')
+    for width in thumbnail_widths(image.width, widths):
+        resized = image if width == image.width else image.resize(
+            (width, max(1, round(image.height * width / image.width))),
+            PILImage.LANCZOS)
+        for extension, (pil_format, options) in FORMATS.items():
+            path = os.path.join(directory, thumbnail_name(digest, width, extension))
+            if os.path.exists(path):
+                continue
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, **options)
+            write_atomically(path, buffer.getvalue())
+    return digest, image.width, image.height
+
+
+def process_job(image_id, source_url, attempts):
+    config = current_app.config
+    try:
+        data = fetch_original(source_url)
+        digest, width, height = make_thumbnails(
+            data, config['THUMBNAIL_DIR'], config['THUMBNAIL_WIDTHS'])
+    except ImageError as err:
+        # retried with exponential backoff, then left as failed
+        failed = attempts >= config['IMAGE_MAX_ATTEMPTS']
+        finish_job(image_id, status='failed' if failed else 'pending', error=str(err),
+                   available_at=request_now() + timedelta(minutes=2 ** attempts))
+        return False
+    finish_job(image_id, status='ready', error=None, digest=digest,
+               width=width, height=height)
+    return True
+
+
+def process_images(batch_size=10, lease=timedelta(minutes=5)):
+    # (processed, failed) of one claimed batch
+    processed = failed = 0
+    for image_id, source_url, attempts in claim_jobs(batch_size, lease):
+        if process_job(image_id, source_url, attempts):
+            processed += 1
+        else:
+            failed += 1
+    return processed, failed
+
+
+def save_upload(storage):
+    # store an uploaded original under its digest and queue it; returns
+    # the URL to use as image_link
+    extension = os.path.splitext(storage.filename or '')[1].lower()
+    if extension not in UPLOAD_TYPES:
+        raise ImageError('upload a JPEG, PNG, GIF or WebP image')
+    data = read_limited(storage.stream, current_app.config['IMAGE_MAX_BYTES'])
+    name = hashlib.sha256(data).hexdigest() + ('.jpg' if extension == '.jpeg' else extension)
+    path = os.path.join(current_app.config['UPLOAD_DIR'], name)
+    if not os.path.exists(path):
+        write_atomically(path, data)
+    url = url_for('uploaded_image', filename=name)
+    enqueue_images(url)
+    return url
+
+
+# Lookup for templates
+
+class ThumbnailIndex:
+    def __init__(self, max_age=60):
+        self.max_age = timedelta(seconds=max_age)
+        self.lock = threading.Lock()
+        self.images = {}
+        self.loaded_at = None
+        self.watermark = None
+
+    def init_app(self, app):
+        self.max_age = timedelta(seconds=app.config.get(
+            'THUMBNAIL_INDEX_MAX_AGE', self.max_age.total_seconds()))
+        app.jinja_env.globals['responsive_image'] = responsive_image
+        app.add_url_rule(THUMBNAIL_PATH + '<path:filename>', 'thumbnail', thumbnail)
+        app.add_url_rule(UPLOAD_PATH + '<path:filename>', 'uploaded_image', uploaded_image)
+
+    def refresh(self):
+        # rows changed since the last load (with some overlap for
+        # transactions that committed late)
+        query = db.session.query(
+            Image.source_url, Image.status, Image.digest, Image.width, Image.updated_at)
+        if self.watermark is not None:
+            query = query.filter(Image.updated_at > self.watermark - self.max_age)
+        for source_url, status, digest, width, updated_at in query.all():
+            if status == 'ready':
+                self.images[source_url] = (digest, width)
+            else:
+                self.images.pop(source_url, None)
+            self.watermark = max(filter(None, (self.watermark, updated_at)))
+        self.loaded_at = datetime.now()
+
+    def get(self, source_url):
+        with self.lock:
+            if self.loaded_at is None or datetime.now() - self.loaded_at > self.max_age:
+                self.refresh()
+            return self.images.get(source_url)
+
+
+thumbnail_index = ThumbnailIndex()
+
+
+def thumbnail_url(digest, width, extension):
+    return url_for('thumbnail', filename=thumbnail_name(digest, width, extension))
+
+
+def srcset(digest, widths, extension):
+    return ', '.join(f'{thumbnail_url(digest, width, extension)} {width}w' for width in widths)
+
+
+def responsive_image(source_url, alt='', width=320):
+    # <picture> with WebP and JPEG thumbnails for a box `width` px wide, or
+    # a plain <img> of the link while there are none
+    thumbnails = thumbnail_index.get(source_url) if source_url else None
+    if thumbnails is None:
+        return Markup('<img src="{}" alt="{}" loading="lazy" />').format(source_url or '', alt)
+    digest, original_width = thumbnails
+    widths = thumbnail_widths(original_width, current_app.config['THUMBNAIL_WIDTHS'])
+    fallback = min(widths, key=lambda w: (w < width, abs(w - width)))
+    sizes = f'{width}px'
+    return Markup(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}" />'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy" /></picture>'
+    ).format(srcset(digest, widths, 'webp'), sizes, thumbnail_url(digest, fallback, 'jpg'),
+             srcset(digest, widths, 'jpg'), sizes, alt)
+
+
+def send_media(directory_key, filename):
+    response = send_from_directory(current_app.config[directory_key], filename,
+                                   max_age=IMMUTABLE)
+    response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE}, immutable'
+    return response
+
+
+def thumbnail(filename):
+    return send_media('THUMBNAIL_DIR', filename)
+
+
+def uploaded_image(filename):
+    return send_media('UPLOAD_DIR', filename)
@@ -0,0 +1,240 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, has_request_context, request, template_rendered, \
+    before_render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Per-request instrumentation: SQL statement count and time (engine cursor
+# events), Jinja render time (template signals) and overall latency (request
+# hooks). Every request is logged as one JSON line and aggregated into
+# Prometheus metrics served at /metrics. Metrics are per process, so under
+# gunicorn each scrape sees the worker that answered it. Statements slower
+# than SLOW_QUERY_MS are logged, with their plan when SLOW_QUERY_EXPLAIN is on.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, 'fields', {})
+        return ' '.join([line] + [f'{key}={value}' for key, value in fields.items()])
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {cumulative}'
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.db_time = {}
+        self.render_time = {}
+        self.queries = {}
+        self.slow_queries = 0
+
+    def observe(self, endpoint, method, status, timings):
+        with self.lock:
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            route = (endpoint, method)
+            for histograms, value in ((self.latency, timings['latency']),
+                                      (self.db_time, timings['db_time']),
+                                      (self.render_time, timings['render_time'])):
+                histograms.setdefault(route, Histogram()).observe(value)
+            self.queries[route] = self.queries.get(route, 0) + timings['queries']
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines.append('# TYPE http_requests_total counter')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{endpoint="{endpoint}",'
+                             f'method="{method}",status="{status}"}} {count}')
+            for name, histograms in (('http_request_duration_seconds', self.latency),
+                                     ('http_request_db_seconds', self.db_time),
+                                     ('http_request_render_seconds', self.render_time)):
+                lines.append(f'# TYPE {name} histogram')
+                for (endpoint, method), histogram in sorted(histograms.items()):
+                    lines.extend(histogram.lines(
+                        name, f'endpoint="{endpoint}",method="{method}"'))
+            lines.append('# TYPE http_request_sql_queries_total counter')
+            for (endpoint, method), count in sorted(self.queries.items()):
+                lines.append(f'http_request_sql_queries_total{{endpoint="{endpoint}",'
+                             f'method="{method}"}} {count}')
+            lines.append('# TYPE sql_slow_queries_total counter')
+            lines.append(f'sql_slow_queries_total {self.slow_queries}')
+        return '\n'.join(lines) + '\n'
+
+
+class Instrumentation:
+    def __init__(self):
+        self.metrics = Metrics()
+        self.log = logging.getLogger('empire.requests')
+        self.slow_log = logging.getLogger('empire.slow_queries')
+        self.slow_query_seconds = None
+        self.explain = False
+
+    def init_app(self, app):
+        slow_ms = app.config.get('SLOW_QUERY_MS', 0)
+        self.slow_query_seconds = slow_ms / 1000 if slow_ms else None
+        self.explain = app.config.get('SLOW_QUERY_EXPLAIN', False)
+
+        if app.config.get('LOG_FORMAT', 'text') == 'json':
+            handler = logging.StreamHandler()
+            handler.setFormatter(JsonFormatter())
+            for logger in (app.logger, self.log, self.slow_log):
+                logger.addHandler(handler)
+        else:
+            # app.logger keeps Flask's own handler in text mode
+            handler = logging.StreamHandler()
+            handler.setFormatter(TextFormatter('[%(asctime)s] %(levelname)s in %(name)s: %(message)s'))
+            for logger in (self.log, self.slow_log):
+                if not logger.handlers:
+                    logger.addHandler(handler)
+        for logger in (self.log, self.slow_log):
+            logger.setLevel(logging.INFO)
+
+        # Engine class events cover the engine Flask-SQLAlchemy creates lazily
+        event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+        before_render_template.connect(self.before_render, app)
+        template_rendered.connect(self.after_render, app)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        if app.config.get('METRICS_ENABLED', True):
+            app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    # SQLAlchemy
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        if has_request_context() and 'instrumented' in g:
+            g.sql_queries += 1
+            g.sql_time += elapsed
+        if self.slow_query_seconds and elapsed >= self.slow_query_seconds:
+            self.slow_query(conn, statement, parameters, executemany, elapsed)
+
+    def slow_query(self, conn, statement, parameters, executemany, elapsed):
+        with self.metrics.lock:
+            self.metrics.slow_queries += 1
+        fields = {
+            'duration_ms': round(elapsed * 1000, 2),
+            'statement': statement,
+            'endpoint': request.endpoint if has_request_context() else None,
+        }
+        if self.explain and not executemany and \
+                statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            # a separate cursor: the original one still holds its results.
+            # The request's transaction must survive a failed EXPLAIN, so it
+            # runs inside a savepoint.
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute('SAVEPOINT explain_slow_query')
+                try:
+                    cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+                    fields['plan'] = cursor.fetchone()[0]
+                except Exception as err:
+                    fields['plan_error'] = str(err)
+                    cursor.execute('ROLLBACK TO SAVEPOINT explain_slow_query')
+                cursor.execute('RELEASE SAVEPOINT explain_slow_query')
+            except Exception as err:
+                fields.setdefault('plan_error', str(err))
+            finally:
+                cursor.close()
+        self.slow_log.warning('slow query', extra={'fields': fields})
+
+    # Jinja
+
+    def before_render(self, sender, template, context, **extra):
+        if 'instrumented' in g:
+            g.render_started.append(time.perf_counter())
+
+    def after_render(self, sender, template, context, **extra):
+        if 'instrumented' in g and g.render_started:
+            g.render_time += time.perf_counter() - g.render_started.pop()
+
+    # Flask
+
+    def before_request(self):
+        g.instrumented = True
+        g.request_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_time = 0.0
+        g.render_started = []
+        g.render_time = 0.0
+
+    def after_request(self, response):
+        if 'instrumented' not in g:
+            return response
+        timings = {
+            'latency': time.perf_counter() - g.request_started,
+            'db_time': g.sql_time,
+            'render_time': g.render_time,
+            'queries': g.sql_queries,
+        }
+        endpoint = request.endpoint or 'unmatched'
+        self.metrics.observe(endpoint, request.method, response.status_code, timings)
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;dur={timings["db_time"] * 1000:.1f}',
+            f'render;dur={timings["render_time"] * 1000:.1f}',
+            f'total;dur={timings["latency"] * 1000:.1f}',
+        ])
+        self.log.info('request', extra={'fields': {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'duration_ms': round(timings['latency'] * 1000, 2),
+            'db_ms': round(timings['db_time'] * 1000, 2),
+            'render_ms': round(timings['render_time'] * 1000, 2),
+            'queries': timings['queries'],
+        }})
+        return response
+
+    def metrics_view(self):
+        return Response(self.metrics.render(),
+                        mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,46 @@
+"""trigram search indexes
+
+Revision ID: 8c2e51a7d4f3
+Revises: 3f1b9c0a2d6e
+Create Date: 2026-10-18 09:40:07.218664
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2e51a7d4f3'
+down_revision = '3f1b9c0a2d6e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # array_to_string is only STABLE, so wrap it to be usable in an index
+    # expression. search.genres_text() queries through the same function.
+    op.execute('''
+        CREATE OR REPLACE FUNCTION search_genres(varchar[]) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$ SELECT array_to_string($1, ' ') $$
+    ''')
+
+    for table in ('venues', 'artists'):
+        for column in ('name', 'city'):
+            op.create_index(
+                f'ix_{table}_{column}_trgm', table, [column],
+                postgresql_using='gin',
+                postgresql_ops={column: 'gin_trgm_ops'}
+            )
+        op.execute(
+            f'CREATE INDEX ix_{table}_genres_trgm ON {table} '
+            f'USING gin (search_genres(genres) gin_trgm_ops)'
+        )
+
+
+def downgrade():
+    for table in ('venues', 'artists'):
+        op.drop_index(f'ix_{table}_genres_trgm', table_name=table)
+        for column in ('name', 'city'):
+            op.drop_index(f'ix_{table}_{column}_trgm', table_name=table)
+    op.execute('DROP FUNCTION IF EXISTS search_genres(varchar[])')
@@ -0,0 +1,72 @@
+"""timezone-aware show times and venue timezones
+
+Revision ID: a8e2d5f7c903
+Revises: f1c8e3a5b726
+Create Date: 2026-10-18 17:36:09.214583
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8e2d5f7c903'
+down_revision = 'f1c8e3a5b726'
+branch_labels = None
+depends_on = None
+
+
+# Stored times were written as UTC wall-clock times (the seed data carries
+# `Z` suffixes, which `timestamp` columns silently dropped).
+STORED_ZONE = 'UTC'
+
+STATS_COLUMNS = [(table, column)
+                 for table in ('venue_stats', 'artist_stats')
+                 for column in ('next_show_time', 'last_show_time')]
+
+
+def add_exclusion_constraints(period):
+    op.execute(f'''ALTER TABLE shows ADD CONSTRAINT shows_venue_no_overlap
+                   EXCLUDE USING gist (venue_id WITH =, {period} WITH &&)''')
+    op.execute(f'''ALTER TABLE shows ADD CONSTRAINT shows_artist_no_overlap
+                   EXCLUDE USING gist (artist_id WITH =, {period} WITH &&)''')
+
+
+def drop_exclusion_constraints():
+    op.drop_constraint('shows_artist_no_overlap', 'shows')
+    op.drop_constraint('shows_venue_no_overlap', 'shows')
+
+
+def upgrade():
+    op.add_column('venues', sa.Column('timezone', sa.String(64), nullable=False,
+                                      server_default=STORED_ZONE))
+
+    drop_exclusion_constraints()
+    op.execute(f'''ALTER TABLE shows ALTER COLUMN start_time TYPE timestamptz
+                   USING start_time AT TIME ZONE '{STORED_ZONE}' ''')
+    for table, column in STATS_COLUMNS:
+        op.execute(f'''ALTER TABLE {table} ALTER COLUMN {column} TYPE timestamptz
+                       USING {column} AT TIME ZONE '{STORED_ZONE}' ''')
+
+    # timestamptz + interval is only STABLE because day and month steps
+    # depend on the session timezone; whole minutes do not, so the period
+    # is immutable and can be indexed by the exclusion constraints
+    op.execute('''
+        CREATE FUNCTION show_period(start_time timestamptz, duration integer)
+        RETURNS tstzrange LANGUAGE sql IMMUTABLE PARALLEL SAFE AS
+        $$ SELECT tstzrange(start_time, start_time + make_interval(mins => duration)) $$''')
+    add_exclusion_constraints('show_period(start_time, duration)')
+
+
+def downgrade():
+    drop_exclusion_constraints()
+    op.execute('DROP FUNCTION show_period(timestamptz, integer)')
+    for table, column in STATS_COLUMNS:
+        op.execute(f'''ALTER TABLE {table} ALTER COLUMN {column} TYPE timestamp
+                       USING {column} AT TIME ZONE '{STORED_ZONE}' ''')
+    op.execute(f'''ALTER TABLE shows ALTER COLUMN start_time TYPE timestamp
+                   USING start_time AT TIME ZONE '{STORED_ZONE}' ''')
+    add_exclusion_constraints(
+        "tsrange(start_time, start_time + duration * interval '1 minute')")
+
+    op.drop_column('venues', 'timezone')
@@ -0,0 +1,52 @@
+"""images and thumbnail job queue
+
+Revision ID: b3f6a9d1e284
+Revises: a8e2d5f7c903
+Create Date: 2026-10-18 18:21:47.903516
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f6a9d1e284'
+down_revision = 'a8e2d5f7c903'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'images',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('source_url', sa.String(), nullable=False),
+        sa.Column('status', sa.String(length=20), server_default='pending', nullable=False),
+        sa.Column('available_at', sa.DateTime(timezone=True),
+                  server_default=sa.text('now()'), nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('digest', sa.String(length=64), nullable=True),
+        sa.Column('width', sa.Integer(), nullable=True),
+        sa.Column('height', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(),
+                  server_default=sa.text("timezone('utc', now())"), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('source_url')
+    )
+    op.create_index('ix_images_claim', 'images', ['status', 'available_at'])
+    op.create_index('ix_images_updated_at', 'images', ['updated_at'])
+
+    # queue the links already stored
+    op.execute('''
+        INSERT INTO images (source_url)
+        SELECT image_link FROM venues WHERE image_link <> ''
+        UNION
+        SELECT image_link FROM artists WHERE image_link <> ''
+        ON CONFLICT DO NOTHING''')
+
+
+def downgrade():
+    op.drop_index('ix_images_updated_at', table_name='images')
+    op.drop_index('ix_images_claim', table_name='images')
+    op.drop_table('images')
@@ -0,0 +1,57 @@
+"""show indexes and constraints
+
+Revision ID: b7d93e4f0a12
+Revises: 8c2e51a7d4f3
+Create Date: 2026-10-18 11:02:55.871340
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d93e4f0a12'
+down_revision = '8c2e51a7d4f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a show without a time, venue or artist cannot be displayed anywhere
+    op.execute('DELETE FROM shows '
+               'WHERE start_time IS NULL OR venue_id IS NULL OR artist_id IS NULL')
+    op.alter_column('shows', 'start_time', existing_type=sa.DateTime(), nullable=False)
+    op.alter_column('shows', 'venue_id', existing_type=sa.Integer(), nullable=False)
+    op.alter_column('shows', 'artist_id', existing_type=sa.Integer(), nullable=False)
+
+    op.drop_constraint('shows_venue_id_fkey', 'shows', type_='foreignkey')
+    op.drop_constraint('shows_artist_id_fkey', 'shows', type_='foreignkey')
+    op.create_foreign_key('shows_venue_id_fkey', 'shows', 'venues',
+                          ['venue_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('shows_artist_id_fkey', 'shows', 'artists',
+                          ['artist_id'], ['id'], ondelete='CASCADE')
+
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'])
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'])
+    op.create_index('ix_shows_start_time_id', 'shows', ['start_time', 'id'])
+    op.create_index('ix_venues_genres', 'venues', ['genres'], postgresql_using='gin')
+    op.create_index('ix_artists_genres', 'artists', ['genres'], postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_artists_genres', table_name='artists')
+    op.drop_index('ix_venues_genres', table_name='venues')
+    op.drop_index('ix_shows_start_time_id', table_name='shows')
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
+
+    op.drop_constraint('shows_artist_id_fkey', 'shows', type_='foreignkey')
+    op.drop_constraint('shows_venue_id_fkey', 'shows', type_='foreignkey')
+    op.create_foreign_key('shows_venue_id_fkey', 'shows', 'venues',
+                          ['venue_id'], ['id'])
+    op.create_foreign_key('shows_artist_id_fkey', 'shows', 'artists',
+                          ['artist_id'], ['id'])
+
+    op.alter_column('shows', 'artist_id', existing_type=sa.Integer(), nullable=True)
+    op.alter_column('shows', 'venue_id', existing_type=sa.Integer(), nullable=True)
+    op.alter_column('shows', 'start_time', existing_type=sa.DateTime(), nullable=True)
@@ -0,0 +1,29 @@
+"""row versions
+
+Revision ID: c4a1f6e2b853
+Revises: b7d93e4f0a12
+Create Date: 2026-10-18 13:27:10.094417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a1f6e2b853'
+down_revision = 'b7d93e4f0a12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists', 'shows'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                       server_default=sa.text("timezone('utc', now())")))
+        op.create_index(f'ix_{table}_updated_at', table, ['updated_at'])
+
+
+def downgrade():
+    for table in ('venues', 'artists', 'shows'):
+        op.drop_index(f'ix_{table}_updated_at', table_name=table)
+        op.drop_column(table, 'updated_at')
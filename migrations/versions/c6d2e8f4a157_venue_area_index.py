@@ -0,0 +1,24 @@
+"""venue area index
+
+Revision ID: c6d2e8f4a157
+Revises: b3f6a9d1e284
+Create Date: 2026-10-18 21:12:40.318205
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6d2e8f4a157'
+down_revision = 'b3f6a9d1e284'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # /venues pages the distinct (state, city) areas by keyset over this index
+    op.create_index('ix_venues_state_city', 'venues', ['state', 'city'])
+
+
+def downgrade():
+    op.drop_index('ix_venues_state_city', table_name='venues')
@@ -0,0 +1,53 @@
+"""show durations and double-booking exclusion constraints
+
+Revision ID: d92f3a7c1e64
+Revises: c4a1f6e2b853
+Create Date: 2026-10-18 15:02:41.518230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd92f3a7c1e64'
+down_revision = 'c4a1f6e2b853'
+branch_labels = None
+depends_on = None
+
+
+def period(alias=''):
+    prefix = f'{alias}.' if alias else ''
+    return (f"tsrange({prefix}start_time, "
+            f"{prefix}start_time + {prefix}duration * interval '1 minute')")
+
+
+def upgrade():
+    # btree_gist provides the GiST opclass for the integer `=` part
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.add_column('shows', sa.Column('duration', sa.Integer(), nullable=False,
+                                     server_default='120'))
+
+    # refuse to guess which of two clashing bookings is the real one
+    for column in ('venue_id', 'artist_id'):
+        clashes = op.get_bind().execute(sa.text(f'''
+            SELECT a.id, b.id FROM shows a JOIN shows b
+              ON a.{column} = b.{column} AND a.id < b.id
+             AND {period('a')} && {period('b')}
+            ORDER BY a.id, b.id LIMIT 20''')).fetchall()
+        if clashes:
+            pairs = ', '.join(f'{a}/{b}' for a, b in clashes)
+            raise RuntimeError(
+                f'overlapping shows on the same {column[:-3]} must be moved '
+                f'or deleted before upgrading: {pairs}')
+
+    op.execute(f'''ALTER TABLE shows ADD CONSTRAINT shows_venue_no_overlap
+                   EXCLUDE USING gist (venue_id WITH =, {period()} WITH &&)''')
+    op.execute(f'''ALTER TABLE shows ADD CONSTRAINT shows_artist_no_overlap
+                   EXCLUDE USING gist (artist_id WITH =, {period()} WITH &&)''')
+
+
+def downgrade():
+    op.drop_constraint('shows_artist_no_overlap', 'shows')
+    op.drop_constraint('shows_venue_no_overlap', 'shows')
+    op.drop_column('shows', 'duration')
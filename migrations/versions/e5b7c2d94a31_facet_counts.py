@@ -0,0 +1,43 @@
+"""facet counts
+
+Revision ID: e5b7c2d94a31
+Revises: d92f3a7c1e64
+Create Date: 2026-10-18 16:11:05.731904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b7c2d94a31'
+down_revision = 'd92f3a7c1e64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'facet_counts',
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('facet', sa.String(length=20), nullable=False),
+        sa.Column('value', sa.String(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('kind', 'facet', 'value')
+    )
+    for table, seeking in (('venues', 'seeking_talent'), ('artists', 'seeking_venue')):
+        op.execute(f'''
+            INSERT INTO facet_counts (kind, facet, value, count)
+            SELECT '{table}', 'genre', genre, count(DISTINCT id)
+              FROM {table}, unnest(genres) AS genre GROUP BY genre
+            UNION ALL
+            SELECT '{table}', 'city', city, count(*) FROM {table} GROUP BY city
+            UNION ALL
+            SELECT '{table}', 'state', state, count(*) FROM {table} GROUP BY state
+            UNION ALL
+            SELECT '{table}', 'seeking', CASE WHEN {seeking} THEN 'yes' ELSE 'no' END,
+                   count(*) FROM {table} GROUP BY {seeking}''')
+
+
+def downgrade():
+    op.drop_table('facet_counts')
@@ -0,0 +1,47 @@
+"""show stats rollups
+
+Revision ID: f1c8e3a5b726
+Revises: e5b7c2d94a31
+Create Date: 2026-10-18 16:48:22.460178
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c8e3a5b726'
+down_revision = 'e5b7c2d94a31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, column, parent in (('venue_stats', 'venue_id', 'venues'),
+                                  ('artist_stats', 'artist_id', 'artists')):
+        op.create_table(
+            table,
+            sa.Column(column, sa.Integer(), nullable=False),
+            sa.Column('past_count', sa.Integer(), server_default='0', nullable=False),
+            sa.Column('upcoming_count', sa.Integer(), server_default='0', nullable=False),
+            sa.Column('next_show_time', sa.DateTime(), nullable=True),
+            sa.Column('last_show_time', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint([column], [f'{parent}.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint(column)
+        )
+        op.create_index(f'ix_{table}_next_show_time', table, ['next_show_time'])
+        op.execute(f'''
+            INSERT INTO {table} ({column}, past_count, upcoming_count,
+                                 next_show_time, last_show_time)
+            SELECT {column},
+                   count(*) FILTER (WHERE start_time <= now()),
+                   count(*) FILTER (WHERE start_time > now()),
+                   min(start_time) FILTER (WHERE start_time > now()),
+                   max(start_time) FILTER (WHERE start_time <= now())
+            FROM shows GROUP BY {column}''')
+
+
+def downgrade():
+    for table in ('artist_stats', 'venue_stats'):
+        op.drop_index(f'ix_{table}_next_show_time', table_name=table)
+        op.drop_table(table)
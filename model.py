@@ -1,5 +1,9 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from flask import g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+from sqlalchemy.orm import selectinload, synonym
 
 
 db = SQLAlchemy()
@@ -7,6 +11,17 @@ db = SQLAlchemy()
 
 # Helper for the models
 
+def request_now():
+    # One aware "now" per request: every past/upcoming split of a request
+    # agrees, and queries compare the indexed timestamptz column against a
+    # plain parameter instead of each computing their own local time.
+    if not has_request_context():
+        return datetime.now(timezone.utc)
+    if 'now' not in g:
+        g.now = datetime.now(timezone.utc)
+    return g.now
+
+
 def get_venue(venue_id):
     return Venue.query.get(venue_id)
 
@@ -16,50 +31,247 @@ def get_artist(artist_id):
 
 
 def venue_past_shows(venue_id):
-    return Show.query.filter(Show.start_time < datetime.now(), Show.venue_id == venue_id).all()
+    return Show.query.filter(Show.start_time <= request_now(), Show.venue_id == venue_id).all()
 
 
 def venue_upcoming_shows(venue_id):
-    return Show.query.filter(Show.start_time > datetime.now(), Show.venue_id == venue_id).all()
+    return Show.query.filter(Show.start_time > request_now(), Show.venue_id == venue_id).all()
 
 
 def artist_past_shows(artist_id):
-    return Show.query.filter(Show.start_time < datetime.now(), Show.artist_id == artist_id).all()
+    return Show.query.filter(Show.start_time <= request_now(), Show.artist_id == artist_id).all()
 
 
 def artist_upcoming_shows(artist_id):
-    return Show.query.filter(Show.start_time > datetime.now(), Show.artist_id == artist_id).all()
+    return Show.query.filter(Show.start_time > request_now(), Show.artist_id == artist_id).all()
+
+
+def split_shows(shows, now=None):
+    # Partition already loaded shows at "now" so a detail page needs a single
+    # shows query for both its past and upcoming sections.
+    now = now or request_now()
+    past_shows, upcoming_shows = [], []
+    for show in shows:
+        if show.start_time > now:
+            upcoming_shows.append(show)
+        else:
+            past_shows.append(show)
+    return past_shows, upcoming_shows
+
+
+def next_upcoming_start(shows, now=None):
+    # the moment the oldest upcoming show turns into a past show
+    now = now or request_now()
+    return min((s.start_time for s in shows if s.start_time > now), default=None)
+
+
+def venue_artist_ids(venue_id):
+    return [row[0] for row in db.session.query(Show.artist_id).filter(
+        Show.venue_id == venue_id).distinct()]
+
+
+def artist_venue_ids(artist_id):
+    return [row[0] for row in db.session.query(Show.venue_id).filter(
+        Show.artist_id == artist_id).distinct()]
+
+
+def get_venue_with_shows(venue_id):
+    # venue + its shows and their artists in two round trips, whatever the
+    # number of shows
+    return Venue.query.options(
+        selectinload(Venue.shows).joinedload(Show.artist)
+    ).filter_by(id=venue_id).first()
+
+
+def get_artist_with_shows(artist_id):
+    return Artist.query.options(
+        selectinload(Artist.shows).joinedload(Show.venue)
+    ).filter_by(id=artist_id).first()
+
+
+def upcoming_show_details(shows, now=None):
+    # Batch version of Show.upcoming: past shows are dropped before any I/O
+    # and the venue/artist columns for the rest come back in one query.
+    now = now or request_now()
+    upcoming = [show for show in shows if show.start_time > now]
+    if not upcoming:
+        return []
+
+    rows = db.session.query(
+        Show.id, Venue.name, Venue.timezone, Artist.name, Artist.image_link
+    ).join(Venue, Show.venue_id == Venue.id).join(
+        Artist, Show.artist_id == Artist.id
+    ).filter(Show.id.in_([show.id for show in upcoming])).all()
+    related = {row[0]: row[1:] for row in rows}
+
+    return [
+        show.upcoming_details(*related[show.id])
+        for show in upcoming if show.id in related
+    ]
+
+
+# Upcoming show counts
+# Read from the venue_stats/artist_stats rollups (see stats.py), either
+# joined into a listing query as a subquery or run on its own for a known
+# list of ids. Entities without shows have no stats row, hence the coalesce
+# in the outer joins and the zero-filled dict.
+
+def upcoming_counts_query(show_column):
+    stats = stats_model(show_column)
+    return db.session.query(
+        stats.entity_id.label('entity_id'),
+        stats.upcoming_count.label('num_upcoming_shows')
+    )
+
+
+def upcoming_counts_subquery(show_column):
+    # (entity_id, num_upcoming_shows) per venue or artist, depending on
+    # whether Show.venue_id or Show.artist_id is passed; meant to be
+    # outer-joined so counts come back in the same query as the entities.
+    return upcoming_counts_query(show_column).subquery()
+
+
+def upcoming_show_counts(show_column, entity_ids):
+    # {entity_id: upcoming_count} for the given ids, zero-filled
+    entity_ids = list(entity_ids)
+    if not entity_ids:
+        return {}
+    counts = dict.fromkeys(entity_ids, 0)
+    counts.update(upcoming_counts_query(show_column).filter(
+        stats_model(show_column).entity_id.in_(entity_ids)).all())
+    return counts
+
+
+def venue_upcoming_show_counts(venue_ids):
+    return upcoming_show_counts(Show.venue_id, venue_ids)
+
+
+def artist_upcoming_show_counts(artist_ids):
+    return upcoming_show_counts(Show.artist_id, artist_ids)
+
+
+def venue_areas_query():
+    # distinct (state, city) areas; /venues pages them by keyset on
+    # (state, city), which ix_venues_state_city answers in order
+    return db.session.query(Venue.state, Venue.city).distinct()
+
+
+def venues_by_area(areas):
+    # The venues of one page of (state, city) areas, with upcoming show
+    # counts joined from venue_stats, grouped per area in the page's order.
+    # Only the venues of those areas are read, whatever the table size.
+    areas = [(area.state, area.city) for area in areas]
+    if not areas:
+        return []
+    upcoming = upcoming_counts_subquery(Show.venue_id)
+    rows = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        db.func.coalesce(upcoming.c.num_upcoming_shows,
+                         0).label('num_upcoming_shows')
+    ).outerjoin(upcoming, upcoming.c.entity_id == Venue.id).filter(
+        db.tuple_(Venue.state, Venue.city).in_(areas)
+    ).order_by(Venue.state, Venue.city, Venue.name).all()
+
+    venues = {area: [] for area in areas}
+    for v in rows:
+        venues[(v.state, v.city)].append({
+            'id': v.id,
+            'name': v.name,
+            'num_upcoming_shows': v.num_upcoming_shows
+        })
+    return [{'city': city, 'state': state, 'venues': venues[(state, city)]}
+            for state, city in areas]
+
+
+DEFAULT_SHOW_DURATION = 120
+
+
+def show_period_sql():
+    # the booked period of a show, as used by the exclusion constraints;
+    # show_period() is an immutable SQL function (see migration a8e2d5f7c903)
+    return db.text("show_period(start_time, duration)")
+
+
+def show_end_time():
+    return Show.start_time + Show.duration * db.literal_column(
+        "interval '1 minute'", db.Interval)
+
+
+def show_period():
+    # same expression as show_period_sql(), so queries can use the GiST index
+    return db.func.show_period(Show.start_time, Show.duration,
+                               type_=postgresql.TSTZRANGE)
+
+
+def row_version_column():
+    # bumped on every ORM update; API ETags and exports are derived from it
+    return db.Column(db.DateTime(), nullable=False, index=True,
+                     default=datetime.utcnow, onupdate=datetime.utcnow,
+                     server_default=db.text("timezone('utc', now())"))
 
 
 # Implement Show and Artist models, and all model relationships and properties, as a database migration.
 class Show(db.Model):
     __tablename__ = 'shows'
+    __table_args__ = (
+        # every past/upcoming lookup filters on one of these pairs
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        # keyset order of the /shows listing
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+        # no double booking: a venue or an artist cannot have two shows whose
+        # [start_time, start_time + duration) periods overlap
+        ExcludeConstraint(
+            (db.column('venue_id'), '='), (show_period_sql(), '&&'),
+            name='shows_venue_no_overlap', using='gist'),
+        ExcludeConstraint(
+            (db.column('artist_id'), '='), (show_period_sql(), '&&'),
+            name='shows_artist_no_overlap', using='gist'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    start_time = db.Column(db.DateTime())
-    venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'))
-    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'))
+    start_time = db.Column(db.DateTime(timezone=True), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey(
+        'venues.id', ondelete='CASCADE'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey(
+        'artists.id', ondelete='CASCADE'), nullable=False)
+    # length of the booking in minutes
+    duration = db.Column(db.Integer, nullable=False,
+                         default=DEFAULT_SHOW_DURATION, server_default=str(DEFAULT_SHOW_DURATION))
+    updated_at = row_version_column()
+
+    @property
+    def end_time(self):
+        return self.start_time + timedelta(minutes=self.duration)
 
     @property
     def upcoming(self):
-        venue = get_venue(self.venue_id)
-        artist = get_artist(self.artist_id)
-
-        if self.start_time > datetime.now():
-            return {
-                "venue_id": self.venue_id,
-                "venue_name": venue.name,
-                "artist_id": self.artist_id,
-                "artist_name": artist.name,
-                "artist_image_link": artist.image_link,
-                "start_time": self.start_time.strftime("%m/%d/%Y, %H:%M")
-            }
-        else:
+        if self.start_time <= request_now():
             return None
+        return self.upcoming_details(self.venue.name, self.venue.timezone,
+                                     self.artist.name, self.artist.image_link)
+
+    def upcoming_details(self, venue_name, venue_timezone, artist_name, artist_image_link):
+        return {
+            "venue_id": self.venue_id,
+            "venue_name": venue_name,
+            "venue_timezone": venue_timezone,
+            "artist_id": self.artist_id,
+            "artist_name": artist_name,
+            "artist_image_link": artist_image_link,
+            "start_time": self.start_time
+        }
 
 
 class Venue(db.Model):
     __tablename__ = 'venues'
+    __table_args__ = (
+        db.Index('ix_venues_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_venues_state_city', 'state', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False, unique=True)
@@ -71,11 +283,16 @@ class Venue(db.Model):
     image_link = db.Column(db.String(500), nullable=False)
     website = db.Column(db.String(), nullable=True)
     facebook_link = db.Column(db.String(120), nullable=True)
+    # IANA name; show times at the venue are entered and shown in it
+    timezone = db.Column(db.String(64), nullable=False, default='UTC', server_default='UTC')
 
     seeking_talent = db.Column(db.Boolean, nullable=False, default=True)
     seeking_description = db.Column(db.String(
         200), nullable=False, default='We are looking for an exciting artist to perform here!')
-    shows = db.relationship('Show', backref='venue', lazy=True)
+    updated_at = row_version_column()
+    shows = db.relationship('Show', backref='venue',
+                            lazy=True, order_by='Show.start_time',
+                            cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return f'<Venue Name: {self.name}, City: {self.city}, State: {self.state}>'
@@ -86,8 +303,7 @@ class Venue(db.Model):
 
     @property
     def full_venue_details(self):
-        past_shows = venue_past_shows(self.id)
-        upcoming_shows = venue_upcoming_shows(self.id)
+        past_shows, upcoming_shows = split_shows(self.shows)
 
         return {
             'id': self.id,
@@ -95,6 +311,7 @@ class Venue(db.Model):
             'address': self.address,
             'city': self.city,
             'state': self.state,
+            'timezone': self.timezone,
             'phone': self.phone,
             'genres': self.genres,
             'website': self.website,
@@ -106,13 +323,15 @@ class Venue(db.Model):
                 'artist_id': previous_show.artist_id,
                 'artist_name': previous_show.artist.name,
                 'artist_image_link': previous_show.artist.image_link,
-                'start_time': previous_show.start_time.strftime("%m/%d/%Y, %H:%M")
+                'venue_timezone': self.timezone,
+                'start_time': previous_show.start_time
             } for previous_show in past_shows],
             'upcoming_shows': [{
-                'artist_id': show.artist.id,
+                'artist_id': show.artist_id,
                 'artist_name': show.artist.name,
                 'artist_image_link': show.artist.image_link,
-                'start_time': show.start_time.strftime("%m/%d/%Y, %H:%M")
+                'venue_timezone': self.timezone,
+                'start_time': show.start_time
             } for show in upcoming_shows],
             'past_shows_count': len(past_shows),
             'upcoming_shows_count': len(upcoming_shows)
@@ -121,6 +340,9 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'artists'
+    __table_args__ = (
+        db.Index('ix_artists_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False, unique=True)
@@ -135,8 +357,11 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean, nullable=False, default=True)
     seeking_description = db.Column(db.String(
         120), nullable=False, default='We are looking to perform at an exciting venue!')
+    updated_at = row_version_column()
 
-    shows = db.relationship('Show', backref='artist', lazy=True)
+    shows = db.relationship('Show', backref='artist',
+                            lazy=True, order_by='Show.start_time',
+                            cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return f'<Artist Name: {self.name}, City: {self.city}, State: {self.state}>'
@@ -147,8 +372,7 @@ class Artist(db.Model):
 
     @property
     def full_artist_details(self):
-        past_shows = artist_past_shows(self.id)
-        upcoming_shows = artist_upcoming_shows(self.id)
+        past_shows, upcoming_shows = split_shows(self.shows)
 
         return {
             'id': self.id,
@@ -166,14 +390,97 @@ class Artist(db.Model):
                 'venue_id': p.venue_id,
                 'venue_name': p.venue.name,
                 'venue_image_link': p.venue.image_link,
-                'start_time': p.start_time.strftime("%m/%d/%Y, %H:%M")
+                'venue_timezone': p.venue.timezone,
+                'start_time': p.start_time
             } for p in past_shows],
             'upcoming_shows': [{
-                'venue_id': u.venue.id,
+                'venue_id': u.venue_id,
                 'venue_name': u.venue.name,
                 'venue_image_link': u.venue.image_link,
-                'start_time': u.start_time.strftime("%m/%d/%Y, %H:%M")
+                'venue_timezone': u.venue.timezone,
+                'start_time': u.start_time
             } for u in upcoming_shows],
             'past_shows_count': len(past_shows),
             'upcoming_shows_count': len(upcoming_shows)
         }
+
+
+class FacetCount(db.Model):
+    # number of venues/artists per genre, city, state and seeking flag,
+    # kept current by the write paths (see facets.py)
+    __tablename__ = 'facet_counts'
+
+    kind = db.Column(db.String(20), primary_key=True)
+    facet = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<FacetCount {self.kind} {self.facet}={self.value}: {self.count}>'
+
+
+def stats_model(show_column):
+    # VenueStats for Show.venue_id, ArtistStats for Show.artist_id
+    return {'venue_id': VenueStats, 'artist_id': ArtistStats}[show_column.key]
+
+
+def stats_count_column():
+    return db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+
+class VenueStats(db.Model):
+    # show counts per venue, maintained by stats.py
+    __tablename__ = 'venue_stats'
+
+    venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'),
+                         primary_key=True)
+    past_count = stats_count_column()
+    upcoming_count = stats_count_column()
+    # the roll job moves venues whose next show has started
+    next_show_time = db.Column(db.DateTime(timezone=True), index=True)
+    last_show_time = db.Column(db.DateTime(timezone=True))
+
+    entity_id = synonym('venue_id')
+
+
+class ArtistStats(db.Model):
+    # show counts per artist, maintained by stats.py
+    __tablename__ = 'artist_stats'
+
+    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'),
+                          primary_key=True)
+    past_count = stats_count_column()
+    upcoming_count = stats_count_column()
+    next_show_time = db.Column(db.DateTime(timezone=True), index=True)
+    last_show_time = db.Column(db.DateTime(timezone=True))
+
+    entity_id = synonym('artist_id')
+
+
+class Image(db.Model):
+    # An image_link and its thumbnails. The table is also the job queue of
+    # the thumbnail worker (see images.py): pending rows are claimed with
+    # FOR UPDATE SKIP LOCKED.
+    __tablename__ = 'images'
+    __table_args__ = (
+        db.Index('ix_images_claim', 'status', 'available_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    source_url = db.Column(db.String(), nullable=False, unique=True)
+    # pending, processing, ready or failed
+    status = db.Column(db.String(20), nullable=False, default='pending',
+                       server_default='pending')
+    # claimable from then on: retry backoff, or the lease of a worker
+    available_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                             default=request_now, server_default=db.func.now())
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    error = db.Column(db.String(), nullable=True)
+    # sha256 of the original; thumbnail file names derive from it
+    digest = db.Column(db.String(64), nullable=True)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    updated_at = row_version_column()
+
+    def __repr__(self):
+        return f'<Image {self.id} {self.status}: {self.source_url}>'
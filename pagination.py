@@ -0,0 +1,78 @@
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from model import db
+
+
+# Keyset (cursor) pagination. Instead of OFFSET, a page is requested
+# relative to the sort key of the last (or first) row already seen, so deep
+# pages cost the same as the first one as long as the key is indexed.
+
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor'])
+
+
+def encode_cursor(values):
+    raw = json.dumps([
+        v.isoformat() if isinstance(v, datetime) else v for v in values
+    ])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_value(column, value):
+    # cursors come from the client, so every value must fit its column
+    if isinstance(column.type, db.DateTime):
+        if not isinstance(value, str):
+            raise TypeError('not a date')
+        value = datetime.fromisoformat(value)
+        if column.type.timezone and value.tzinfo is None:
+            raise ValueError('naive time for a timestamptz column')
+        return value
+    if isinstance(value, bool) or not isinstance(value, column.type.python_type):
+        raise TypeError('wrong type')
+    return value
+
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError('wrong length')
+        return [decode_value(c, v) for c, v in zip(columns, values)]
+    except (ValueError, TypeError):
+        raise ValueError('invalid cursor')
+
+
+def row_key(row, columns):
+    return [getattr(row, c.key) for c in columns]
+
+
+def keyset_page(query, columns, after=None, before=None, per_page=20):
+    # `columns` must end with a unique column (normally the primary key) so
+    # that the ordering is total and no row is skipped between pages.
+    key = db.tuple_(*columns)
+
+    if before:
+        values = decode_cursor(before, columns)
+        rows = query.filter(key < tuple(values)).order_by(
+            *[c.desc() for c in columns]).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        items = rows[:per_page][::-1]
+        return Page(
+            items,
+            encode_cursor(row_key(items[-1], columns)) if items else None,
+            encode_cursor(row_key(items[0], columns)) if has_more else None
+        )
+
+    if after:
+        values = decode_cursor(after, columns)
+        query = query.filter(key > tuple(values))
+    rows = query.order_by(*columns).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    return Page(
+        items,
+        encode_cursor(row_key(items[-1], columns)) if has_more else None,
+        encode_cursor(row_key(items[0], columns)) if after and items else None
+    )
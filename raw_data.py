@@ -6,6 +6,7 @@ venues = [
         "address": "1015 Folsom Street",
         "city": "San Francisco",
         "state": "CA",
+        "timezone": "America/Los_Angeles",
         "phone": "123-123-1234",
         "website": "https://www.themusicalhop.com",
         "facebook_link": "https://www.facebook.com/TheMusicalHop",
@@ -20,6 +21,7 @@ venues = [
         "address": "335 Delancey Street",
         "city": "New York",
         "state": "NY",
+        "timezone": "America/New_York",
         "phone": "914-003-1132",
         "website": "https://www.theduelingpianos.com",
         "facebook_link": "https://www.facebook.com/theduelingpianos",
@@ -33,6 +35,7 @@ venues = [
         "address": "34 Whiskey Moore Ave",
         "city": "San Francisco",
         "state": "CA",
+        "timezone": "America/Los_Angeles",
         "phone": "415-000-1234",
         "website": "https://www.parksquarelivemusicandcoffee.com",
         "facebook_link": "https://www.facebook.com/ParkSquareLiveMusicAndCoffee",
@@ -103,41 +106,41 @@ shows = [
     {
         "venue_id": 2,
         "artist_id": 4,
-        "start_time": "2019-05-21T21:30:00.000Z"
+        "start_time": "2019-05-22T21:30:00.000Z"
     },
     {
         "venue_id": 2,
         "artist_id": 4,
-        "start_time": "2035-04-01T20:00:00.000Z"
+        "start_time": "2035-04-02T20:00:00.000Z"
     },
     {
         "venue_id": 2,
         "artist_id": 5,
-        "start_time": "2035-04-08T20:00:00.000Z"
+        "start_time": "2035-04-09T20:00:00.000Z"
     },
     {
         "venue_id": 2,
         "artist_id": 6,
-        "start_time": "2035-04-15T20:00:00.000Z"
+        "start_time": "2035-04-16T20:00:00.000Z"
     },
     {
         "venue_id": 3,
         "artist_id": 4,
-        "start_time": "2019-05-21T21:30:00.000Z"
+        "start_time": "2019-05-23T21:30:00.000Z"
     },
     {
         "venue_id": 3,
         "artist_id": 4,
-        "start_time": "2035-04-08T20:00:00.000Z"
+        "start_time": "2035-04-03T20:00:00.000Z"
     },
     {
         "venue_id": 3,
         "artist_id": 5,
-        "start_time": "2035-04-08T20:00:00.000Z"
+        "start_time": "2035-04-10T20:00:00.000Z"
     },
     {
         "venue_id": 3,
         "artist_id": 6,
-        "start_time": "2035-04-15T20:00:00.000Z"
+        "start_time": "2035-04-17T20:00:00.000Z"
     }
 ]
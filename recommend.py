@@ -0,0 +1,287 @@
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from model import db, Show, Venue, Artist, request_now
+
+
+# Artist <-> venue matchmaking. Each side is kept in memory as NumPy arrays
+# ordered by id: a 0/1 genre matrix (one column per genre seen so far),
+# encoded city and state, and the seeking flag. Scoring every candidate for
+# one venue or artist is a matrix-vector product plus a few vectorized
+# comparisons. Writes patch single rows; after max_age the arrays are
+# rebuilt in a background thread while requests keep using the current
+# ones, and edits made meanwhile are replayed on the new arrays. Past
+# co-bookings come from one grouped query on `shows`.
+
+WEIGHTS = {'genres': 0.6, 'location': 0.25, 'history': 0.15}
+
+SIDES = {
+    # kind: (model, seeking column, show column, counterpart kind)
+    'venues': (Venue, 'seeking_talent', Show.venue_id, 'artists'),
+    'artists': (Artist, 'seeking_venue', Show.artist_id, 'venues'),
+}
+
+
+class Side:
+    def __init__(self, genre_count):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.genres = np.zeros((0, genre_count), dtype=np.uint8)
+        self.cities = np.zeros(0, dtype=np.int32)
+        self.states = np.zeros(0, dtype=np.int32)
+        self.seeking = np.zeros(0, dtype=bool)
+        self.active = np.zeros(0, dtype=bool)
+
+    def row(self, entity_id):
+        row = int(np.searchsorted(self.ids, entity_id))
+        if row < len(self.ids) and self.ids[row] == entity_id:
+            return row
+        return None
+
+    def add_genre_column(self):
+        self.genres = np.pad(self.genres, ((0, 0), (0, 1)))
+
+    def load(self, ids, genre_cells, cities, states, seeking):
+        # whole side at once; genre_cells: (rows, columns) of the 1s
+        self.ids = np.array(ids, dtype=np.int64)
+        rows, columns = (np.array(cells, dtype=np.intp) for cells in genre_cells)
+        self.genres = np.zeros((len(ids), self.genres.shape[1]), dtype=np.uint8)
+        self.genres[rows, columns] = 1
+        self.cities = np.array(cities, dtype=np.int32)
+        self.states = np.array(states, dtype=np.int32)
+        self.seeking = np.array(seeking, dtype=bool)
+        self.active = np.ones(len(ids), dtype=bool)
+
+    def put(self, entity_id, genres, city, state, seeking):
+        # single-row edits; each new row copies the arrays
+        row = self.row(entity_id)
+        if row is None:
+            row = int(np.searchsorted(self.ids, entity_id))
+            self.ids = np.insert(self.ids, row, entity_id)
+            self.genres = np.insert(self.genres, row, 0, axis=0)
+            self.cities = np.insert(self.cities, row, 0)
+            self.states = np.insert(self.states, row, 0)
+            self.seeking = np.insert(self.seeking, row, False)
+            self.active = np.insert(self.active, row, False)
+        self.genres[row] = genres
+        self.cities[row] = city
+        self.states[row] = state
+        self.seeking[row] = seeking
+        self.active[row] = True
+
+
+class Recommender:
+    def __init__(self, max_age=3600):
+        self.max_age = timedelta(seconds=max_age)
+        self.lock = threading.RLock()
+        self.app = None
+        self.built_at = None
+        self.genre_columns = {}
+        self.places = {}
+        self.sides = {}
+        # edits made while a rebuild runs, or None
+        self.reloading = None
+
+    def init_app(self, app):
+        self.app = app
+        self.max_age = timedelta(seconds=app.config.get(
+            'RECOMMEND_INDEX_MAX_AGE', self.max_age.total_seconds()))
+
+    def code(self, key):
+        return self.places.setdefault(key, len(self.places) + 1)
+
+    def genre_vector(self, genres):
+        for genre in genres or ():
+            if genre not in self.genre_columns:
+                self.genre_columns[genre] = len(self.genre_columns)
+                for side in self.sides.values():
+                    side.add_genre_column()
+        vector = np.zeros(len(self.genre_columns), dtype=np.uint8)
+        vector[[self.genre_columns[genre] for genre in genres or ()]] = 1
+        return vector
+
+    def put(self, kind, entity):
+        _, seeking, _, _ = SIDES[kind]
+        self.put_row(kind, entity.id, entity.city, entity.state, entity.genres,
+                     bool(getattr(entity, seeking)))
+
+    def put_row(self, kind, entity_id, city, state, genres, seeking):
+        state = (state or '').upper()
+        self.sides[kind].put(
+            entity_id,
+            self.genre_vector(genres),
+            self.code(((city or '').strip().lower(), state)),
+            self.code(state),
+            seeking,
+        )
+
+    def build(self):
+        # -> (genre columns, places, sides) read in one pass over each
+        # table; the genre matrices are sized once every genre is known
+        genre_columns = {}
+        places = {}
+
+        def code(key):
+            return places.setdefault(key, len(places) + 1)
+
+        loaded = {}
+        for kind, (model, seeking, _, _) in SIDES.items():
+            rows = db.session.query(
+                model.id, model.city, model.state, model.genres,
+                getattr(model, seeking)
+            ).order_by(model.id).all()
+            genre_cells = ([], [])
+            cities, states = [], []
+            for i, (_, city, state, genres, _) in enumerate(rows):
+                for genre in genres or ():
+                    genre_cells[0].append(i)
+                    genre_cells[1].append(genre_columns.setdefault(
+                        genre, len(genre_columns)))
+                state = (state or '').upper()
+                cities.append(code(((city or '').strip().lower(), state)))
+                states.append(code(state))
+            loaded[kind] = ([row[0] for row in rows], genre_cells, cities, states,
+                            [bool(row[4]) for row in rows])
+        sides = {}
+        for kind, columns in loaded.items():
+            sides[kind] = Side(len(genre_columns))
+            sides[kind].load(*columns)
+        return genre_columns, places, sides
+
+    def install(self, built, edits=()):
+        # with the lock held
+        self.genre_columns, self.places, self.sides = built
+        self.built_at = datetime.now()
+        for edit in edits:
+            if edit[0] == 'put':
+                self.put_row(*edit[1:])
+            else:
+                self.deactivate(*edit[1:])
+
+    def ensure(self):
+        # with the lock held; only the very first build makes a request wait
+        if self.built_at is None:
+            self.install(self.build())
+        elif datetime.now() - self.built_at > self.max_age and self.reloading is None:
+            self.reloading = []
+            threading.Thread(target=self.reload, daemon=True).start()
+
+    def reload(self):
+        try:
+            with self.app.app_context():
+                built = self.build()
+        except Exception:
+            self.app.logger.exception('Could not rebuild the recommender')
+            with self.lock:
+                self.reloading = None
+            return
+        with self.lock:
+            self.install(built, self.reloading)
+            self.reloading = None
+
+    # Incremental updates, called by the write paths after a commit.
+
+    def saved(self, kind, entity):
+        _, seeking, _, _ = SIDES[kind]
+        with self.lock:
+            if self.built_at is not None:
+                self.put(kind, entity)
+            if self.reloading is not None:
+                self.reloading.append(('put', kind, entity.id, entity.city, entity.state,
+                                       list(entity.genres or ()),
+                                       bool(getattr(entity, seeking))))
+
+    def venue_saved(self, venue):
+        self.saved('venues', venue)
+
+    def artist_saved(self, artist):
+        self.saved('artists', artist)
+
+    def venue_deleted(self, venue_id):
+        with self.lock:
+            if self.built_at is not None:
+                self.deactivate('venues', int(venue_id))
+            if self.reloading is not None:
+                self.reloading.append(('deactivate', 'venues', int(venue_id)))
+
+    def deactivate(self, kind, entity_id):
+        row = self.sides[kind].row(entity_id)
+        if row is not None:
+            self.sides[kind].active[row] = False
+
+    def co_bookings(self, kind, entity_id):
+        # {counterpart id: number of past shows together}
+        _, _, show_column, counterpart = SIDES[kind]
+        counterpart_column = SIDES[counterpart][2]
+        return dict(db.session.query(
+            counterpart_column, db.func.count(Show.id)
+        ).filter(show_column == entity_id, Show.start_time <= request_now()
+                 ).group_by(counterpart_column).all())
+
+    def scores(self, kind, entity_id):
+        # (candidate side, scores, shared genre counts, co-bookings); None if unknown
+        with self.lock:
+            self.ensure()
+            source = self.sides[kind]
+            row = source.row(entity_id)
+            if row is None or not source.active[row]:
+                model = SIDES[kind][0]
+                entity = model.query.filter_by(id=entity_id).first()
+                if entity is None:
+                    return None
+                self.put(kind, entity)
+                row = source.row(entity_id)
+            candidates = self.sides[SIDES[kind][3]]
+            genres = source.genres[row]
+            city, state = source.cities[row], source.states[row]
+
+            shared = candidates.genres @ genres.astype(np.int32)
+            union = candidates.genres.sum(axis=1, dtype=np.int32) + int(genres.sum()) - shared
+            genre_score = shared / np.maximum(union, 1)
+            location_score = 0.5 * (candidates.states == state) + \
+                0.5 * (candidates.cities == city)
+
+            history = np.zeros(len(candidates.ids))
+            bookings = self.co_bookings(kind, entity_id)
+            for counterpart_id, count in bookings.items():
+                candidate = candidates.row(counterpart_id)
+                if candidate is not None:
+                    history[candidate] = np.log1p(count)
+            if history.any():
+                history /= history.max()
+
+            score = (WEIGHTS['genres'] * genre_score +
+                     WEIGHTS['location'] * location_score +
+                     WEIGHTS['history'] * history)
+            score[~(candidates.active & candidates.seeking)] = -np.inf
+            return candidates, score, shared, bookings
+
+    def recommend(self, kind, entity_id, limit=10):
+        # best candidates of the other side for a venue or an artist
+        result = self.scores(kind, entity_id)
+        if result is None:
+            return None
+        candidates, score, shared, bookings = result
+        limit = min(limit, int(np.isfinite(score).sum()))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-score, limit - 1)[:limit]
+        top = top[np.argsort(-score[top], kind='stable')]
+
+        model = SIDES[SIDES[kind][3]][0]
+        ids = [int(candidates.ids[row]) for row in top]
+        entities = {e.id: e for e in model.query.filter(model.id.in_(ids)).all()}
+        return [{
+            'id': entity_id,
+            'name': entities[entity_id].name,
+            'city': entities[entity_id].city,
+            'state': entities[entity_id].state,
+            'genres': entities[entity_id].genres,
+            'shared_genres': int(shared[row]),
+            'past_shows': bookings.get(entity_id, 0),
+            'score': round(float(score[row]), 4),
+        } for row, entity_id in zip(top, ids) if entity_id in entities]
+
+
+recommender = Recommender()
@@ -0,0 +1,56 @@
+from model import db, Show, Venue, Artist, upcoming_counts_subquery
+
+
+# Venue/artist search backed by the pg_trgm GIN indexes created in the
+# 8c2e51a7d4f3 migration. `ILIKE '%term%'` on an indexed column is answered
+# from the trigram index, and results are ranked by trigram similarity.
+
+SHOW_COLUMNS = {Venue: Show.venue_id, Artist: Show.artist_id}
+
+
+def genres_text(model):
+    # must match the expression used by the ix_<table>_genres_trgm index
+    return db.func.search_genres(model.genres)
+
+
+def escape_like(term):
+    # backslash is Postgres' default LIKE escape character
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search(model, term, limit=50):
+    term = term.strip()
+    pattern = f'%{escape_like(term)}%'
+    genres = genres_text(model)
+    upcoming = upcoming_counts_subquery(SHOW_COLUMNS[model])
+
+    rank = db.func.greatest(
+        db.func.similarity(model.name, term),
+        db.func.similarity(model.city, term),
+        db.func.similarity(genres, term)
+    )
+
+    rows = db.session.query(
+        model.id,
+        model.name,
+        db.func.coalesce(upcoming.c.num_upcoming_shows,
+                         0).label('num_upcoming_shows'),
+        # total number of matches, before the limit is applied
+        db.func.count().over().label('total')
+    ).outerjoin(
+        upcoming, upcoming.c.entity_id == model.id
+    ).filter(db.or_(
+        model.name.ilike(pattern),
+        model.city.ilike(pattern),
+        genres.ilike(pattern)
+    )).order_by(rank.desc(), model.name).limit(limit).all()
+
+    return {
+        'count': rows[0].total if rows else 0,
+        'data': [{
+            'id': row.id,
+            'name': row.name,
+            'num_upcoming_shows': row.num_upcoming_shows
+        } for row in rows]
+    }
+
@@ -0,0 +1,85 @@
+import secrets
+
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+from cache import FileSystemBackend
+
+
+# Server-side sessions. The cookie only carries a signed random session id;
+# the session data lives in a store shared by every worker (a directory,
+# which can sit on a volume shared between nodes), so any worker behind a
+# plain round-robin balancer can serve any request.
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class ServerSideSessionInterface(SessionInterface):
+    session_class = ServerSideSession
+    salt = 'server-side-session'
+
+    def __init__(self, store, prefix='session:'):
+        self.store = store
+        self.prefix = prefix
+
+    def signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self.signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            data = self.store.get(self.prefix + sid) if sid else None
+            if data is not None:
+                return self.session_class(data, sid=sid)
+        return self.session_class(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified:
+                self.store.delete(self.prefix + session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        response.vary.add('Cookie')
+        if not self.should_set_cookie(app, session):
+            return
+
+        # permanent sessions slide their expiry, so refresh the stored copy
+        if session.modified or session.permanent:
+            self.store.set(self.prefix + session.sid, dict(session),
+                           app.permanent_session_lifetime.total_seconds())
+        response.set_cookie(
+            name,
+            self.signer(app).sign(session.sid.encode()).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_session(app):
+    # SESSION_BACKEND 'cookie' keeps Flask's signed cookie sessions
+    if app.config.get('SESSION_BACKEND') == 'filesystem':
+        app.session_interface = ServerSideSessionInterface(
+            FileSystemBackend(app.config['SESSION_DIR']))
@@ -0,0 +1,161 @@
+from datetime import timedelta
+
+from sqlalchemy.orm import joinedload
+
+from cache import render_cache
+from model import (db, Show, Venue, Artist, request_now, upcoming_show_details,
+                   venue_upcoming_show_counts, artist_upcoming_show_counts)
+
+
+# Precomputed data for the home page widgets: the most recently listed
+# venues and artists and the shows of the coming week. It is kept in the
+# render cache backend and patched in place by the write paths, so serving
+# the home page does not touch the database. A full rebuild only happens
+# when the snapshot is missing, older than `max_age`, or after a delete.
+# Rebuilds and patches hold the backend's lock on the key, so concurrent
+# writes in other workers are applied one after the other, never lost.
+
+class HomeSnapshot:
+    # v2: aware show times (snapshots with naive ones are never read back)
+    KEY = 'home:snapshot:v2'
+    WEEK = timedelta(days=7)
+
+    def __init__(self, cache, size=10, max_shows=30, max_age=3600):
+        self.cache = cache
+        self.size = size
+        self.max_shows = max_shows
+        self.max_age = timedelta(seconds=max_age)
+
+    def init_app(self, app):
+        self.size = app.config.get('HOME_RECENT_SIZE', self.size)
+        self.max_age = timedelta(seconds=app.config.get(
+            'HOME_SNAPSHOT_MAX_AGE', self.max_age.total_seconds()))
+
+    def current(self):
+        snapshot = self.cache.backend.get(self.KEY)
+        if snapshot is None or request_now() - snapshot['built_at'] > self.max_age:
+            return None
+        return snapshot
+
+    def load(self):
+        # (snapshot, rebuilt): a fresh rebuild already reflects the last write
+        snapshot = self.current()
+        if snapshot is not None:
+            return snapshot, False
+        with self.cache.backend.lock_key(self.KEY):
+            # another worker may have rebuilt it while we waited
+            snapshot = self.current()
+            if snapshot is not None:
+                return snapshot, False
+            return self.rebuild(), True
+
+    def store(self, snapshot):
+        # kept a little longer than max_age; load() decides on staleness
+        self.cache.backend.set(self.KEY, snapshot, 2 * self.max_age.total_seconds())
+
+    def get(self):
+        snapshot, _ = self.load()
+        # the snapshot covers max_age beyond one week, so the window can
+        # slide forward without a rebuild
+        now = request_now()
+        return {
+            'venues': snapshot['venues'],
+            'artists': snapshot['artists'],
+            'shows': [
+                show for starts_at, show in snapshot['shows']
+                if now < starts_at <= now + self.WEEK
+            ],
+        }
+
+    def rebuild(self):
+        now = request_now()
+        venues = db.session.query(Venue.id, Venue.name).order_by(
+            Venue.id.desc()).limit(self.size).all()
+        artists = db.session.query(Artist.id, Artist.name).order_by(
+            Artist.id.desc()).limit(self.size).all()
+        venue_counts = venue_upcoming_show_counts(v.id for v in venues)
+        artist_counts = artist_upcoming_show_counts(a.id for a in artists)
+        shows = Show.query.options(
+            joinedload(Show.venue), joinedload(Show.artist)
+        ).filter(
+            Show.start_time > now,
+            Show.start_time <= now + self.WEEK + self.max_age
+        ).order_by(Show.start_time).limit(self.max_shows).all()
+
+        snapshot = {
+            'built_at': now,
+            'venues': [{'id': v.id, 'name': v.name,
+                        'num_upcoming_shows': venue_counts[v.id]} for v in venues],
+            'artists': [{'id': a.id, 'name': a.name,
+                         'num_upcoming_shows': artist_counts[a.id]} for a in artists],
+            'shows': [(s.start_time, s.upcoming_details(
+                s.venue.name, s.venue.timezone, s.artist.name, s.artist.image_link))
+                for s in shows],
+        }
+        self.store(snapshot)
+        return snapshot
+
+    # Incremental updates, called by the write paths after a commit.
+
+    def update(self, patch):
+        # patch(snapshot) edits it in place; a rebuild already has the change
+        with self.cache.backend.lock_key(self.KEY):
+            snapshot = self.current()
+            if snapshot is None:
+                self.rebuild()
+            else:
+                patch(snapshot)
+                self.store(snapshot)
+
+    def entity_saved(self, kind, entity_id, name, show_fields):
+        self.update(lambda snapshot: self.patch_entity(
+            snapshot, kind, entity_id, name, show_fields))
+
+    def patch_entity(self, snapshot, kind, entity_id, name, show_fields):
+        entries = snapshot[kind]
+        for entry in entries:
+            if entry['id'] == entity_id:
+                entry['name'] = name
+                break
+        else:
+            entries.insert(0, {'id': entity_id, 'name': name,
+                               'num_upcoming_shows': 0})
+            entries.sort(key=lambda e: e['id'], reverse=True)
+            del entries[self.size:]
+        id_field = kind[:-1] + '_id'
+        for _, show in snapshot['shows']:
+            if show[id_field] == entity_id:
+                show.update(show_fields)
+
+    def venue_saved(self, venue):
+        self.entity_saved('venues', venue.id, venue.name,
+                          {'venue_name': venue.name, 'venue_timezone': venue.timezone})
+
+    def artist_saved(self, artist):
+        self.entity_saved('artists', artist.id, artist.name,
+                          {'artist_name': artist.name,
+                           'artist_image_link': artist.image_link})
+
+    def show_created(self, show):
+        if show.start_time <= request_now():
+            return
+        self.update(lambda snapshot: self.patch_show(snapshot, show))
+
+    def patch_show(self, snapshot, show):
+        for kind, entity_id in (('venues', show.venue_id), ('artists', show.artist_id)):
+            for entry in snapshot[kind]:
+                if entry['id'] == entity_id:
+                    entry['num_upcoming_shows'] += 1
+        if show.start_time <= snapshot['built_at'] + self.WEEK + self.max_age:
+            snapshot['shows'].extend(
+                (show.start_time, details) for details in upcoming_show_details([show]))
+            snapshot['shows'].sort(key=lambda s: s[0])
+            del snapshot['shows'][self.max_shows:]
+
+    def invalidate(self):
+        # deletes can pull older rows into the lists, so start over
+        with self.cache.backend.lock_key(self.KEY):
+            self.cache.backend.delete(self.KEY)
+
+
+home_snapshot = HomeSnapshot(render_cache)
@@ -0,0 +1,96 @@
+from collections import defaultdict
+from sqlalchemy.dialects import postgresql
+
+from model import db, Show, VenueStats, ArtistStats, request_now
+
+
+# Per-venue and per-artist show statistics (past/upcoming counts, next and
+# last show time) kept in venue_stats/artist_stats so listings and search
+# read counts instead of aggregating shows. New shows are added with an
+# upsert in the booking transaction, deletes recompute the entities they
+# touch, and roll_stats() moves entities whose next show has started from
+# upcoming to past; run it on a schedule (`flask roll_show_stats`).
+
+ROLLUPS = {
+    'venues': (VenueStats, Show.venue_id),
+    'artists': (ArtistStats, Show.artist_id),
+}
+
+
+def aggregate_query(show_column, now):
+    upcoming = Show.start_time > now
+    return db.select(
+        show_column,
+        db.func.count(Show.id).filter(~upcoming),
+        db.func.count(Show.id).filter(upcoming),
+        db.func.min(Show.start_time).filter(upcoming),
+        db.func.max(Show.start_time).filter(~upcoming),
+    ).group_by(show_column)
+
+
+def recompute_stats(kind, entity_ids=None, now=None):
+    # rebuild the rows of the given entities (all when None) from shows
+    stats, show_column = ROLLUPS[kind]
+    now = now or request_now()
+    delete = db.delete(stats)
+    query = aggregate_query(show_column, now)
+    if entity_ids is not None:
+        entity_ids = list(entity_ids)
+        if not entity_ids:
+            return
+        delete = delete.where(stats.entity_id.in_(entity_ids))
+        query = query.where(show_column.in_(entity_ids))
+    db.session.execute(delete)
+    db.session.execute(db.insert(stats).from_select(
+        [stats.entity_id, stats.past_count, stats.upcoming_count,
+         stats.next_show_time, stats.last_show_time], query))
+
+
+def refresh_show_stats(now=None):
+    for kind in ROLLUPS:
+        recompute_stats(kind, now=now)
+
+
+def record_shows(shows, now=None):
+    # add new shows to the rollups; call before the commit that adds them
+    now = now or request_now()
+    for kind, (stats, show_column) in ROLLUPS.items():
+        rows = defaultdict(lambda: {'past_count': 0, 'upcoming_count': 0,
+                                    'next_show_time': None, 'last_show_time': None})
+        for show in shows:
+            row = rows[getattr(show, show_column.key)]
+            if show.start_time > now:
+                row['upcoming_count'] += 1
+                row['next_show_time'] = min(filter(None, (row['next_show_time'], show.start_time)))
+            else:
+                row['past_count'] += 1
+                row['last_show_time'] = max(filter(None, (row['last_show_time'], show.start_time)))
+        if not rows:
+            continue
+        insert = postgresql.insert(stats).values([
+            {show_column.key: entity_id, **row} for entity_id, row in sorted(rows.items())
+        ])
+        # least/greatest skip NULLs
+        db.session.execute(insert.on_conflict_do_update(
+            index_elements=[show_column.key],
+            set_={
+                'past_count': stats.past_count + insert.excluded.past_count,
+                'upcoming_count': stats.upcoming_count + insert.excluded.upcoming_count,
+                'next_show_time': db.func.least(stats.next_show_time,
+                                                insert.excluded.next_show_time),
+                'last_show_time': db.func.greatest(stats.last_show_time,
+                                                   insert.excluded.last_show_time),
+            }
+        ))
+
+
+def roll_stats(now=None):
+    # {kind: entities rolled}; uses the index on next_show_time
+    now = now or request_now()
+    rolled = {}
+    for kind, (stats, _) in ROLLUPS.items():
+        entity_ids = [row[0] for row in db.session.query(stats.entity_id).filter(
+            stats.next_show_time <= now).all()]
+        recompute_stats(kind, entity_ids, now)
+        rolled[kind] = len(entity_ids)
+    return rolled
@@ -0,0 +1,57 @@
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The app reads its configuration when it is imported. Tests that need the
+# database run against TEST_DATABASE_URL, a Postgres database migrated to
+# head whose contents they replace, and are skipped when it is not set.
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+os.environ['DATABASE_URL'] = TEST_DATABASE_URL or 'postgresql://localhost/unused'
+os.environ.setdefault('SECRET_KEY', 'test')
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return app
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+
+@pytest.fixture
+def db(app_context):
+    if not TEST_DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    from command import clear_db
+    from model import db
+    clear_db(db)
+    yield db
+    db.session.remove()
+
+
+@pytest.fixture
+def count_queries():
+    # with count_queries() as statements: ... -> the SQL statements run
+    @contextmanager
+    def counter():
+        statements = []
+
+        def after_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(Engine, 'after_cursor_execute', after_cursor_execute)
+    return counter
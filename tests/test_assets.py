@@ -0,0 +1,53 @@
+from assets import minify, minify_css, minify_js, rewrite_css_urls
+
+
+def test_minify_css():
+    css = '''
+    /* header */
+    .a > .b ,  .c {
+        color : red ;
+        margin: 0 auto;
+    }
+    '''
+    assert minify_css(css) == '.a>.b,.c{color : red;margin: 0 auto}'
+
+
+def test_minify_css_keeps_strings():
+    css = '.a:before { content: "  /* not a comment */  ;" ; }'
+    assert minify_css(css) == '.a:before{content: "  /* not a comment */  ;"}'
+
+
+def test_minify_js_keeps_lines():
+    js = '''
+    // setup
+    var a = 1
+    var b = "http://example.com"
+
+        a += b  // trailing comments stay
+    '''
+    assert minify_js(js) == ('var a = 1\nvar b = "http://example.com"\n'
+                             'a += b  // trailing comments stay')
+
+
+def test_minified_files_are_left_alone():
+    text = 'a  {  b : c }'
+    assert minify('css/bootstrap.min.css', text) == text
+    assert minify('css/main.css', text) == 'a{b : c}'
+
+
+def test_rewrite_css_urls():
+    files = {'fonts/x.woff': '/assets/fonts/x.0123456789ab.woff',
+             'img/bg.png': '/assets/img/bg.ba9876543210.png'}
+    css = ('a{src:url("../fonts/x.woff?v=1#iefix")}'
+           "b{background:url('../img/bg.png')}"
+           'c{background:url(../img/missing.png)}'
+           'd{background:url(data:image/png;base64,AAAA)}'
+           'e{background:url(/img/absolute.png)}'
+           'f{background:url(https://example.com/a.png)}')
+    assert rewrite_css_urls(css, 'css/main.css', files) == (
+        'a{src:url("/assets/fonts/x.0123456789ab.woff?v=1#iefix")}'
+        "b{background:url('/assets/img/bg.ba9876543210.png')}"
+        'c{background:url(/static/img/missing.png)}'
+        'd{background:url(data:image/png;base64,AAAA)}'
+        'e{background:url(/img/absolute.png)}'
+        'f{background:url(https://example.com/a.png)}')
@@ -0,0 +1,83 @@
+from datetime import datetime, time, timedelta, timezone
+
+from availability import AvailabilityIndex, free_slots_sql, group_slots
+from formatting import timezone as pytz_timezone
+from model import Artist, Show, Venue
+
+NOW = datetime(2026, 11, 6, 12, 0, tzinfo=timezone.utc)
+
+
+def at(hours):
+    return NOW + timedelta(hours=hours)
+
+
+def entry(periods):
+    return {'loaded_at': NOW, 'expired': False, 'periods': periods}
+
+
+PERIODS = {1: ([at(2), at(8)], [at(4), at(10)])}
+
+
+def test_is_free():
+    is_free = AvailabilityIndex.is_free
+    assert is_free(PERIODS, 1, at(0), at(2))
+    assert not is_free(PERIODS, 1, at(1), at(3))
+    assert not is_free(PERIODS, 1, at(3), at(5))
+    assert is_free(PERIODS, 1, at(4), at(8))
+    assert not is_free(PERIODS, 1, at(7), at(11))
+    assert is_free(PERIODS, 1, at(10), at(12))
+    assert is_free(PERIODS, 2, at(3), at(5))
+
+
+def test_insert_keeps_periods_sorted():
+    index = AvailabilityIndex(horizon_days=30)
+    loaded = entry({})
+    for start in (8, 2, 5, 5):
+        index.insert(loaded, 1, at(start), at(start + 2))
+    assert loaded['periods'][1] == ([at(2), at(5), at(8)], [at(4), at(7), at(10)])
+    assert not index.is_free(loaded['periods'], 1, at(6), at(7))
+
+
+def test_insert_ignores_periods_outside_the_window():
+    index = AvailabilityIndex(horizon_days=1)
+    loaded = entry({})
+    index.insert(loaded, 1, at(-3), at(-1))
+    index.insert(loaded, 1, at(24), at(26))
+    assert loaded['periods'] == {}
+
+
+def test_slots_use_the_entity_offset():
+    # the SQL path gets instants in the connection's timezone, the index
+    # path venue-local ones; both must print the same
+    local = pytz_timezone('Europe/Berlin').localize(datetime(2026, 11, 6, 20, 0))
+    from_sql = local.astimezone(timezone(timedelta(hours=-5)))
+    result = group_slots([(1, 'A', 'Europe/Berlin', local),
+                          (1, 'A', 'Europe/Berlin', from_sql)])
+    assert result == {'count': 1, 'data': [{'id': 1, 'name': 'A', 'free': [
+        '2026-11-06T20:00:00+01:00', '2026-11-06T20:00:00+01:00']}]}
+
+
+def test_sql_and_index_paths_agree(db):
+    db.session.add_all([
+        Venue(name=f'Venue {zone}', city='Springfield', state='XX', address='1 Main Street',
+              phone='555-0000', genres=['Jazz'], image_link='https://example.com/v.jpg',
+              timezone=zone)
+        for zone in ('America/Los_Angeles', 'Europe/Berlin', 'Asia/Tokyo')])
+    db.session.commit()
+    venue = Venue.query.filter_by(timezone='Europe/Berlin').one()
+    start = (datetime.now(timezone.utc) + timedelta(days=10)).date()
+    db.session.add(Show(venue=venue, artist=Artist(
+        name='Booked', city='Springfield', state='XX', phone='555-0000', genres=['Jazz'],
+        image_link='https://example.com/a.jpg'),
+        start_time=pytz_timezone('Europe/Berlin').localize(
+            datetime.combine(start + timedelta(days=2), time(20, 0)))))
+    db.session.commit()
+
+    query = {'start': start, 'end': start + timedelta(days=6), 'at': time(20, 0),
+             'duration': 180, 'weekdays': [], 'state': 'XX'}
+    index = AvailabilityIndex(horizon_days=60)
+    entry = index.build('venues', datetime.now(timezone.utc))
+    from_index = index.free_slots(entry, 'venues', **query)
+    assert free_slots_sql('venues', **query) == from_index
+    assert len(from_index['data']) == 3
+    assert len(next(v for v in from_index['data'] if v['id'] == venue.id)['free']) == 6
@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from booking import BookingError, parse_booking
+
+
+def test_parse_booking():
+    assert parse_booking({'venue_id': '1', 'artist_id': 2,
+                          'start_time': '2036-01-01T20:00', 'duration': '90'}) == {
+        'venue_id': 1, 'artist_id': 2,
+        'start_time': datetime(2036, 1, 1, 20, 0), 'duration': 90}
+
+
+def test_parse_booking_defaults_and_offsets():
+    booking = parse_booking({'venue_id': 1, 'artist_id': 2,
+                             'start_time': '2036-01-01T20:00:00Z'})
+    assert booking['start_time'] == datetime(2036, 1, 1, 20, 0, tzinfo=timezone.utc)
+    assert booking['duration'] == 120
+
+
+@pytest.mark.parametrize('fields', [
+    {'artist_id': 2, 'start_time': '2036-01-01T20:00'},
+    {'venue_id': 'one', 'artist_id': 2, 'start_time': '2036-01-01T20:00'},
+    {'venue_id': 1, 'artist_id': 2, 'start_time': 'someday'},
+    {'venue_id': 1, 'artist_id': 2, 'start_time': '2036-01-01T20:00', 'duration': 0},
+    {'venue_id': 1, 'artist_id': 2, 'start_time': '2036-01-01T20:00', 'duration': '1.5'},
+])
+def test_parse_booking_rejects(fields):
+    with pytest.raises(BookingError):
+        parse_booking(fields)
+
+
+@pytest.mark.parametrize('start_time', [1700000000, None, ['2036-01-01T20:00']])
+def test_parse_booking_rejects_non_string_start_time(start_time):
+    with pytest.raises(BookingError):
+        parse_booking({'venue_id': 1, 'artist_id': 2, 'start_time': start_time})
+
+
+def test_batch_with_numeric_start_time_is_a_bad_request(app):
+    response = app.test_client().post('/shows/batch', json=[
+        {'venue_id': 1, 'artist_id': 2, 'start_time': 1700000000}])
+    assert response.status_code == 400
+    assert 'start_time' in response.get_json()['error']
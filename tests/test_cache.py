@@ -0,0 +1,41 @@
+import os
+import threading
+import time
+
+from cache import FileSystemBackend, MemoryBackend, RenderCache
+
+
+def test_sweep_drops_expired_then_oldest(tmp_path):
+    backend = FileSystemBackend(str(tmp_path), max_entries=3)
+    backend.set('expired', 1, -1)
+    for age, key in enumerate('abcde'):
+        backend.set(key, key, 60)
+        os.utime(backend.path(key), (time.time() - age, time.time() - age))
+    with backend.lock_key('a'):
+        assert backend.sweep() == 3
+    assert [backend.get(key) for key in 'abcde'] == ['a', 'b', 'c', None, None]
+    assert backend.get('expired') is None
+    assert os.path.exists(backend.path('a') + '.lock')
+
+
+def test_writes_trigger_a_sweep(tmp_path):
+    backend = FileSystemBackend(str(tmp_path), max_entries=10)
+    for i in range(FileSystemBackend.SWEEP_EVERY):
+        backend.set(str(i), i, 60)
+    assert len(backend) == 10
+
+
+def test_counters_survive_concurrent_requests():
+    cache = RenderCache()
+    cache.backend = MemoryBackend()
+
+    def lookups():
+        for _ in range(2000):
+            cache.get('venue', 1, 'page')
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.stats()['misses'] == 16000
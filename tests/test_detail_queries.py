@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta, timezone
+
+from model import Show, Venue, Artist, get_venue_with_shows, get_artist_with_shows
+
+
+def make_venue(name):
+    return Venue(name=name, city='San Francisco', state='CA', address='1 Main Street',
+                 phone='555-0000', genres=['Jazz'], image_link='https://example.com/v.jpg')
+
+
+def make_artist(name):
+    return Artist(name=name, city='San Francisco', state='CA', phone='555-0000',
+                  genres=['Jazz'], image_link='https://example.com/a.jpg')
+
+
+def seed_shows(db, prefix, count):
+    # one venue and one artist with `count` shows each, half of them past,
+    # every show with a different counterpart
+    venue, artist = make_venue(f'{prefix} venue'), make_artist(f'{prefix} artist')
+    db.session.add_all([venue, artist])
+    now = datetime.now(timezone.utc)
+    for i in range(count):
+        start_time = now + timedelta(hours=3 * (i - count // 2) + 1)
+        db.session.add_all([
+            Show(venue=venue, artist=make_artist(f'{prefix} artist {i}'),
+                 start_time=start_time),
+            Show(venue=make_venue(f'{prefix} venue {i}'), artist=artist,
+                 start_time=start_time),
+        ])
+    db.session.commit()
+    return venue.id, artist.id
+
+
+def detail_queries(db, count_queries, load, entity_id, details):
+    db.session.remove()
+    with count_queries() as statements:
+        getattr(load(entity_id), details)
+    return len(statements)
+
+
+def test_venue_detail_query_count_does_not_grow_with_shows(db, count_queries):
+    one, _ = seed_shows(db, 'one', 1)
+    many, _ = seed_shows(db, 'many', 40)
+    queries = [detail_queries(db, count_queries, get_venue_with_shows, venue_id,
+                              'full_venue_details') for venue_id in (one, many)]
+    assert queries == [2, 2]
+
+
+def test_artist_detail_query_count_does_not_grow_with_shows(db, count_queries):
+    _, one = seed_shows(db, 'one', 1)
+    _, many = seed_shows(db, 'many', 40)
+    queries = [detail_queries(db, count_queries, get_artist_with_shows, artist_id,
+                              'full_artist_details') for artist_id in (one, many)]
+    assert queries == [2, 2]
@@ -0,0 +1,27 @@
+from facets import matching_total
+
+SUMMARY = {
+    'genre': [('Jazz', 7), ('Rock n Roll', 4)],
+    'state': [('CA', 6), ('NY', 4)],
+    'city': [('San Francisco', 5), ('New York', 4), ('Oakland', 1)],
+    'seeking': [('yes', 6), ('no', 4)],
+}
+
+
+def filters(**selected):
+    return {'genre': [], 'city': None, 'state': None, 'seeking': None, **selected}
+
+
+def test_matching_total_without_filters():
+    assert matching_total('venues', SUMMARY, filters()) == 10
+
+
+def test_matching_total_with_one_value():
+    assert matching_total('venues', SUMMARY, filters(genre=['Jazz'])) == 7
+    assert matching_total('venues', SUMMARY, filters(city='Oakland')) == 1
+    assert matching_total('venues', SUMMARY, filters(seeking='no')) == 4
+
+
+def test_matching_total_unknown_with_several_values():
+    assert matching_total('venues', SUMMARY, filters(genre=['Jazz', 'Rock n Roll'])) is None
+    assert matching_total('venues', SUMMARY, filters(state='CA', seeking='yes')) is None
@@ -0,0 +1,130 @@
+import io
+import os
+from datetime import datetime
+
+import pytest
+from PIL import Image as PILImage
+from werkzeug.datastructures import FileStorage
+
+import images
+from images import (ImageError, check_public_host, make_thumbnails, responsive_image,
+                    save_upload, thumbnail_index, thumbnail_name, thumbnail_widths)
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'static', 'img', 'front-splash.jpg')
+
+
+@pytest.fixture(scope='module')
+def original():
+    with open(FIXTURE, 'rb') as f:
+        return f.read()
+
+
+def test_thumbnail_widths_never_upscale():
+    assert thumbnail_widths(4448, [160, 320, 640]) == [160, 320, 640]
+    assert thumbnail_widths(300, [160, 320, 640]) == [160, 300]
+    assert thumbnail_widths(100, [160, 320, 640]) == [100]
+
+
+def test_make_thumbnails(original, tmp_path):
+    digest, width, height = make_thumbnails(original, str(tmp_path), [160, 320])
+    # the JPEG is decoded at a reduced scale that still covers 320px
+    assert 320 <= width <= 4448
+    assert round(width * 2965 / 4448) == height
+    for thumbnail_width in (160, 320):
+        for extension, pil_format in (('webp', 'WEBP'), ('jpg', 'JPEG')):
+            path = tmp_path / thumbnail_name(digest, thumbnail_width, extension)
+            with PILImage.open(path) as thumbnail:
+                assert thumbnail.format == pil_format
+                assert thumbnail.width == thumbnail_width
+                assert thumbnail.height == round(height * thumbnail_width / width)
+
+
+def test_make_thumbnails_keeps_existing_files(original, tmp_path):
+    digest, _, _ = make_thumbnails(original, str(tmp_path), [160])
+    path = tmp_path / thumbnail_name(digest, 160, 'jpg')
+    mtime = path.stat().st_mtime_ns
+    make_thumbnails(original, str(tmp_path), [160])
+    assert path.stat().st_mtime_ns == mtime
+
+
+def test_make_thumbnails_rejects_other_data(tmp_path):
+    with pytest.raises(ImageError):
+        make_thumbnails(b'<html></html>', str(tmp_path), [160])
+
+
+@pytest.mark.parametrize('url', [
+    'ftp://93.184.216.34/image.jpg',
+    'file:///etc/passwd',
+    'http:///image.jpg',
+    'http://127.0.0.1/image.jpg',
+    'http://10.0.0.8/image.jpg',
+    'http://169.254.169.254/latest/meta-data',
+    'http://[::1]:8080/image.jpg',
+])
+def test_check_public_host_rejects(url):
+    with pytest.raises(ImageError):
+        check_public_host(url)
+
+
+def test_check_public_host_accepts_public_address():
+    check_public_host('https://93.184.216.34/image.jpg')
+
+
+@pytest.fixture
+def thumbnails(app):
+    # an index loaded with one processed image, without the database
+    images_before = thumbnail_index.images
+    thumbnail_index.images = {'https://example.com/a.jpg': ('ab' * 32, 500)}
+    thumbnail_index.loaded_at = datetime.now()
+    with app.test_request_context():
+        yield
+    thumbnail_index.images = images_before
+    thumbnail_index.loaded_at = None
+
+
+def test_responsive_image_with_thumbnails(thumbnails):
+    html = str(responsive_image('https://example.com/a.jpg', 'Venue "A"', width=320))
+    prefix = '/media/thumbs/ab/' + 'ab' * 12
+    assert html.startswith('<picture><source type="image/webp" ')
+    assert f'{prefix}-160.webp 160w, {prefix}-320.webp 320w, {prefix}-500.webp 500w' in html
+    assert f'src="{prefix}-320.jpg"' in html
+    assert 'sizes="320px"' in html
+    assert 'alt="Venue &#34;A&#34;"' in html
+
+
+def test_responsive_image_falls_back_to_the_link(thumbnails):
+    html = str(responsive_image('https://example.com/<new>.jpg', 'B'))
+    assert html == ('<img src="https://example.com/&lt;new&gt;.jpg" alt="B" '
+                    'loading="lazy" />')
+    assert str(responsive_image(None)) == '<img src="" alt="" loading="lazy" />'
+
+
+@pytest.fixture
+def uploads(app, tmp_path, monkeypatch):
+    queued = []
+    monkeypatch.setattr(images, 'enqueue_images', queued.append)
+    monkeypatch.setitem(app.config, 'UPLOAD_DIR', str(tmp_path))
+    with app.test_request_context():
+        yield tmp_path, queued
+
+
+def test_save_upload(uploads, original):
+    directory, queued = uploads
+    url = save_upload(FileStorage(io.BytesIO(original), filename='Splash.JPEG'))
+    name = url.rsplit('/', 1)[1]
+    assert url == f'/media/uploads/{name}'
+    assert name.endswith('.jpg')
+    assert (directory / name).read_bytes() == original
+    assert queued == [url]
+
+
+def test_save_upload_rejects_other_types(uploads):
+    with pytest.raises(ImageError):
+        save_upload(FileStorage(io.BytesIO(b'x'), filename='notes.txt'))
+
+
+def test_save_upload_rejects_large_files(uploads, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMAGE_MAX_BYTES', 10)
+    with pytest.raises(ImageError):
+        save_upload(FileStorage(io.BytesIO(b'x' * 11), filename='big.png'))
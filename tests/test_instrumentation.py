@@ -0,0 +1,16 @@
+import logging
+
+from instrumentation import TextFormatter
+
+
+def test_text_format_keeps_fields():
+    record = logging.LogRecord('empire.requests', logging.INFO, __file__, 1, 'request', None, None)
+    record.fields = {'endpoint': 'index', 'queries': 3}
+    assert TextFormatter('%(message)s').format(record) == 'request endpoint=index queries=3'
+
+
+def test_text_mode_attaches_a_handler(app):
+    from app import instrumentation
+    assert app.config['LOG_FORMAT'] == 'text'
+    for logger in (instrumentation.log, instrumentation.slow_log):
+        assert any(isinstance(h.formatter, TextFormatter) for h in logger.handlers)
@@ -0,0 +1,55 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from model import Artist, Show, Venue
+from pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    columns = [Show.start_time, Show.id]
+    values = [datetime(2026, 11, 6, 20, 0, tzinfo=timezone.utc), 42]
+    assert decode_cursor(encode_cursor(values), columns) == values
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(['a/b+c?' * 10, 1])
+    assert set(cursor) <= set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+                              '0123456789-_=')
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    encode_cursor([1]),
+    encode_cursor([1, 2, 3]),
+    'eyJhIjogMX0=',  # {"a": 1}
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, [Show.start_time, Show.id])
+
+
+@pytest.mark.parametrize('columns, values', [
+    ([Show.start_time, Show.id], [1700000000, 1]),
+    ([Show.start_time, Show.id], ['yesterday', 1]),
+    ([Show.start_time, Show.id], ['2026-11-06T20:00:00', 1]),
+    ([Show.start_time, Show.id], ['2026-11-06T20:00:00+00:00', '1']),
+    ([Show.start_time, Show.id], ['2026-11-06T20:00:00+00:00', True]),
+    ([Artist.name, Artist.id], [['a'], 1]),
+    ([Artist.name, Artist.id], [None, 1]),
+    ([Venue.state, Venue.city], ['CA', 7]),
+])
+def test_wrong_typed_cursor(columns, values):
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(values), columns)
+
+
+def test_string_and_integer_cursor():
+    assert decode_cursor(encode_cursor(['Guns N Petals', 4]),
+                         [Artist.name, Artist.id]) == ['Guns N Petals', 4]
+
+
+@pytest.mark.parametrize('path', ['/shows', '/artists', '/venues'])
+def test_wrong_typed_cursor_is_a_bad_request(app, path):
+    cursor = encode_cursor([1700000000, ['x']])
+    assert app.test_client().get(path, query_string={'after': cursor}).status_code == 400